@@ -0,0 +1,202 @@
+# Decoder benchmarks
+# Run from the extension folder: python Benchmark.py [transactions]
+
+import sys
+import time
+import timeit
+import tracemalloc
+from CC1101SpiProtocol import CC1101SpiProtocol, SpiByte
+from CC1101SpiDecoder import CC1101SpiDecoder, SpiTransaction
+from TrafficGenerator import TrafficGenerator
+
+
+# Typical transactions: (mosi bytes, miso bytes)
+TRANSACTIONS = {
+    "register write":   ([0x0D, 0x10], [0x0F, 0x0F]),
+    "register read":    ([0x8D, 0x00], [0x0F, 0x10]),
+    "burst write":      ([0x4D, 0x10, 0xB1, 0x3B], [0x0F, 0x0F, 0x0F, 0x0F]),
+    "status read":      ([0xF5, 0x00], [0x1F, 0x0D]),
+    "command strobe":   ([0x34], [0x0F]),
+    "fifo read (64)":   ([0xFF] + [0x00] * 64, [0x1F] + list(range(64))),
+}
+
+# FIFO-heavy traffic: 64-byte bursts in both directions with RXBYTES/TXBYTES polls in between
+FIFO_TRANSACTIONS = {
+    "fifo write (64)":  ([0x7F] + list(range(64)), [0x0F] * 65),
+    "fifo read (64)":   ([0xFF] + [0x00] * 64, [0x1F] + list(range(64))),
+    "rxbytes poll":     ([0xFB, 0x00], [0x1F, 0x40]),
+    "txbytes poll":     ([0xFA, 0x00], [0x2F, 0x00]),
+}
+
+
+def make_protocol_frame(mosi, miso):
+    return [SpiByte(x, y) for x, y in zip(mosi, miso)]
+
+def bench_process_frame(number=100000):
+    '''
+    Per-transaction cost of CC1101SpiProtocol.process_frame.
+    '''
+    protocol = CC1101SpiProtocol()
+    results = {}
+    for name, (mosi, miso) in TRANSACTIONS.items():
+        protocol_frame = make_protocol_frame(mosi, miso)
+        seconds = min(timeit.repeat(lambda: protocol.process_frame(protocol_frame), number=number, repeat=3))
+        results[name] = seconds / number
+    return results
+
+def bench_construct_table(number=20000):
+    '''
+    Per-transaction cost of CC1101SpiDecoder.construct_table on FIFO-heavy traffic.
+    '''
+    decoder = CC1101SpiDecoder()
+    results = {}
+    for name, (mosi, miso) in FIFO_TRANSACTIONS.items():
+        protocol_frame = make_protocol_frame(mosi, miso)
+        protocol_msg = decoder.protocol.process_frame(protocol_frame)
+        seconds = min(timeit.repeat(lambda: decoder.construct_table(protocol_msg, protocol_frame), number=number, repeat=3))
+        results[name] = seconds / number
+    return results
+
+def bench_cache(transactions=200000):
+    '''
+    Decoding cost of polling-dominated traffic with and without the FrameCache, in transactions/sec.
+    '''
+    polls = [
+        ([0xF5, 0x00], [0x1F, 0x0D]),   # MARCSTATE = RX
+        ([0xFB, 0x00], [0x1F, 0x00]),   # RXBYTES = 0
+        ([0xFA, 0x00], [0x1F, 0x00]),   # TXBYTES = 0
+        ([0x3D], [0x1F]),               # SNOP
+    ]
+    mix = polls * 15 + list(FIFO_TRANSACTIONS.values())[:2]
+    stream = [SpiTransaction(n, n + 0.5, make_protocol_frame(*mix[n % len(mix)])) for n in range(transactions)]
+
+    results = {}
+    for name, cache_size in (("cache off", 0), ("cache on", 4096)):
+        decoder = CC1101SpiDecoder(cache_size=cache_size)
+        begin = time.perf_counter()
+        for transaction in stream:
+            decoder.decode_transaction(transaction)
+        results[name] = transactions / (time.perf_counter() - begin)
+    return results
+
+def bench_vector_decode(transactions=1000000):
+    '''
+    Throughput of VectorDecoder.decode_arrays compared to process_frame, in transactions/sec.
+    Uses the TRANSACTIONS mix repeated to the requested count.
+    '''
+    try:
+        import numpy as np
+        import VectorDecoder
+    except ImportError:
+        return None
+
+    mix = list(TRANSACTIONS.values())
+    mosi = np.array([x for n in range(transactions) for x in mix[n % len(mix)][0]], dtype=np.uint8)
+    miso = np.array([x for n in range(transactions) for x in mix[n % len(mix)][1]], dtype=np.uint8)
+    group = np.repeat(np.arange(transactions), [len(mix[n % len(mix)][0]) for n in range(transactions)])
+    start_time = np.arange(len(mosi), dtype=np.float64)
+    end_time = start_time + 0.5
+
+    begin = time.perf_counter()
+    VectorDecoder.decode_arrays(mosi, miso, group, start_time, end_time)
+    vector_seconds = time.perf_counter() - begin
+
+    protocol = CC1101SpiProtocol()
+    protocol_frames = [make_protocol_frame(*x) for x in mix]
+    count = min(transactions, 100000)
+    begin = time.perf_counter()
+    for n in range(count):
+        protocol.process_frame(protocol_frames[n % len(mix)])
+    python_seconds = time.perf_counter() - begin
+
+    return {
+        "VectorDecoder.decode_arrays": transactions / vector_seconds,
+        "CC1101SpiProtocol.process_frame": count / python_seconds,
+    }
+
+def make_decoder():
+    '''
+    The Logic 2 HLA if the saleae package is installed, otherwise the saleae-free decoder it is built on.
+    '''
+    try:
+        from HighLevelAnalyzer import Hla
+    except ImportError:
+        return CC1101SpiDecoder()
+    return Hla()
+
+def bench_decode(transactions=100000, seed=0, mix=None):
+    '''
+    End-to-end decode of synthetic traffic (TrafficGenerator) through decode(), frame by frame as Logic 2 does,
+    and of the same transactions through CC1101SpiProtocol.process_frame alone.
+    Returns input frames/sec, ns per SPI byte and peak memory of each.
+    The peak memory is measured in a second run, as tracemalloc slows down the decoder.
+    '''
+    frames = list(TrafficGenerator(seed, mix).frames(transactions))
+    spi_bytes = sum(1 for x in frames if x.data.get("mosi") is not None)
+
+    protocol_frames = []
+    queue = []
+    for frame in frames:
+        if frame.type == "result":
+            queue.append(SpiByte(frame.data["mosi"][0], frame.data["miso"][0]))
+        elif frame.type == "disable" and queue:
+            protocol_frames.append(queue)
+            queue = []
+        else:
+            queue = []
+    protocol_bytes = sum(len(x) for x in protocol_frames)
+
+    def run_decode():
+        decoder = make_decoder()
+        for frame in frames:
+            decoder.decode(frame)
+        decoder.flush()
+
+    def run_process_frame():
+        protocol = CC1101SpiProtocol()
+        for protocol_frame in protocol_frames:
+            protocol.process_frame(protocol_frame)
+
+    results = {}
+    for name, function, count, byte_count in (
+            ("{}.decode".format(type(make_decoder()).__name__), run_decode, len(frames), spi_bytes),
+            ("CC1101SpiProtocol.process_frame", run_process_frame, len(protocol_frames), protocol_bytes)):
+        begin = time.perf_counter()
+        function()
+        seconds = time.perf_counter() - begin
+
+        tracemalloc.start()
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results[name] = (count / seconds, seconds / byte_count * 1e9, peak)
+    return results
+
+def report(title, results):
+    print(title)
+    for name, seconds in results.items():
+        print("    {:<20} {:>10.0f} ns/transaction".format(name, seconds * 1e9))
+
+
+def report_throughput(title, results):
+    print(title)
+    if results is None:
+        print("    skipped (numpy not installed)")
+        return
+    for name, rate in results.items():
+        print("    {:<32} {:>12.0f} transactions/sec".format(name, rate))
+
+
+def report_decode(title, results):
+    print(title)
+    for name, (rate, ns_per_byte, peak) in results.items():
+        print("    {:<32} {:>12.0f} frames/sec {:>8.0f} ns/byte {:>10.1f} KiB peak".format(name, rate, ns_per_byte, peak / 1024))
+
+
+if __name__ == "__main__":
+    report_decode("Synthetic traffic", bench_decode(int(sys.argv[1]) if len(sys.argv) > 1 else 100000))
+    report("CC1101SpiProtocol.process_frame", bench_process_frame())
+    report("CC1101SpiDecoder.construct_table (FIFO traffic)", bench_construct_table())
+    report_throughput("Polling traffic (FrameCache)", bench_cache())
+    report_throughput("Vectorized decoding", bench_vector_decode())
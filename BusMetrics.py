@@ -0,0 +1,282 @@
+# Bus Metrics
+# SPI bus performance metrics computed from the decoded transactions, in rolling windows with constant memory:
+# throughput, CSn duty cycle, inter-transaction gaps, per-register access latency and FIFO headroom.
+#
+# Usage: python BusMetrics.py capture.csv|capture.bin [window seconds]
+
+import sys
+from bisect import bisect_right
+from collections import deque, namedtuple
+from CC1101SpiProtocol import ProtocolFrameType, STATUS_TABLE
+from CC1101SpiDecoder import CC1101SpiDecoder
+from OfflineDecoder import iter_decode_capture
+
+
+# TX and RX FIFO size in bytes
+FIFO_SIZE = 64
+
+# FIFO_BYTES_AVAILABLE[3:0] of the status byte saturates: 15 means 15 or more bytes
+STATUS_FIFO_BYTES_MAX = 15
+
+# Upper edges of the inter-transaction gap histogram buckets [s]; the last bucket holds longer gaps
+GAP_BUCKETS = (
+    1e-6, 2e-6, 5e-6,
+    1e-5, 2e-5, 5e-5,
+    1e-4, 2e-4, 5e-4,
+    1e-3, 2e-3, 5e-3,
+    1e-2, 2e-2, 5e-2,
+    1e-1, 2e-1, 5e-1,
+    1.0,
+)
+
+# Summary of one window. Times are seconds from the first transaction.
+#   csn_duty:           fraction of the window with a transaction in progress (first byte start to last byte end)
+#   min_rx_headroom:    lowest free space in the RX FIFO seen in RXBYTES reads and in the status byte of read
+#                       accesses, where it is exact below 15 available bytes (None if not seen)
+#   min_tx_bytes:       lowest TX FIFO fill seen in TXBYTES reads while transmitting (None if not read)
+#   min_tx_headroom:    lowest free space in the TX FIFO seen in the status byte of write accesses, saturating at 15
+#   rx_near_overflow:   RX FIFO overflow, or RXBYTES reads within overflow_margin bytes of a full FIFO
+#   tx_near_full:       TX FIFO writes with at most overflow_margin bytes free
+#   rx_near_empty:      RX FIFO reads with at most underflow_margin bytes available
+#   tx_near_underflow:  TX FIFO underflow, or TXBYTES reads within underflow_margin bytes of an empty FIFO in TX
+WindowSummary = namedtuple("WindowSummary", [
+    "start", "end", "transactions", "bytes", "bytes_per_sec", "transactions_per_sec", "csn_duty",
+    "min_gap", "max_gap", "min_rx_headroom", "min_tx_bytes", "min_tx_headroom",
+    "rx_near_overflow", "tx_near_full", "rx_near_empty", "tx_near_underflow",
+])
+
+# Report label of every FIFO warning counter of WindowSummary
+FIFO_WARNINGS = (
+    ("rx_near_overflow",    "Windows near RX FIFO overflow:"),
+    ("tx_near_full",        "Windows with TX FIFO near full:"),
+    ("rx_near_empty",       "Windows with RX FIFO near empty:"),
+    ("tx_near_underflow",   "Windows near TX FIFO underflow:"),
+)
+
+
+class AccessLatency:
+    '''
+    Transaction durations of one register.
+    '''
+    __slots__ = ("count", "total", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        self.min = duration if self.min is None else min(self.min, duration)
+        self.max = duration if self.max is None else max(self.max, duration)
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+class WindowAccumulator:
+    '''
+    Running totals of the current window.
+    '''
+    __slots__ = ("transactions", "bytes", "active_time", "min_gap", "max_gap",
+                 "min_rx_headroom", "min_tx_bytes", "min_tx_headroom",
+                 "rx_near_overflow", "tx_near_full", "rx_near_empty", "tx_near_underflow")
+
+    def __init__(self):
+        self.transactions = 0
+        self.bytes = 0
+        self.active_time = 0.0
+        self.min_gap = None
+        self.max_gap = None
+        self.min_rx_headroom = None
+        self.min_tx_bytes = None
+        self.min_tx_headroom = None
+        self.rx_near_overflow = 0
+        self.tx_near_full = 0
+        self.rx_near_empty = 0
+        self.tx_near_underflow = 0
+
+class BusMetrics:
+    '''
+    Decoder listener collecting bus metrics.
+    Completed windows are kept in a bounded deque (most recent max_windows) and passed to on_window, if given.
+    '''
+    def __init__(self, window=1.0, max_windows=1000, overflow_margin=4, underflow_margin=4, on_window=None):
+        self.window = window
+        self.overflow_margin = overflow_margin
+        self.underflow_margin = underflow_margin
+        self.on_window = on_window
+        self.windows = deque(maxlen=max_windows)
+
+        self.origin = None
+        self.window_start = 0.0
+        self.current = WindowAccumulator()
+        self.previous_end = None
+
+        # Whole capture
+        self.transactions = 0
+        self.bytes = 0
+        self.active_time = 0.0
+        self.last_end = 0.0
+        self.gap_histogram = [0] * (len(GAP_BUCKETS) + 1)
+        self.latency = {}
+
+    def add_transaction(self, transaction, protocol_msg, frame):
+        if self.origin is None:
+            self.origin = transaction.start_time
+        start = float(transaction.start_time - self.origin)
+        end = float(transaction.end_time - self.origin)
+        duration = end - start
+
+        if start >= self.window_start + self.window:
+            self.close_window()
+            # Skip idle windows without transactions
+            self.window_start += self.window * int((start - self.window_start) // self.window)
+
+        current = self.current
+        size = len(transaction.spi_bytes)
+        current.transactions += 1
+        current.bytes += size
+        current.active_time += duration
+        self.transactions += 1
+        self.bytes += size
+        self.active_time += duration
+        self.last_end = max(self.last_end, end)
+
+        if self.previous_end is not None:
+            gap = start - self.previous_end
+            self.gap_histogram[bisect_right(GAP_BUCKETS, gap)] += 1
+            current.min_gap = gap if current.min_gap is None else min(current.min_gap, gap)
+            current.max_gap = gap if current.max_gap is None else max(current.max_gap, gap)
+        self.previous_end = end
+
+        register = protocol_msg.request.register
+        if register is not None:
+            latency = self.latency.get(register)
+            if latency is None:
+                latency = self.latency[register] = AccessLatency()
+            latency.add(duration)
+
+        self.track_fifo(transaction, protocol_msg, current)
+
+    def track_fifo(self, transaction, protocol_msg, current):
+        # The status byte of every transaction shows the FIFO over/underflow states
+        status = STATUS_TABLE[transaction.spi_bytes[0].miso]
+        state = status.state
+        if state == "RXFIFO_OVERFLOW":
+            current.rx_near_overflow += 1
+        elif state == "TXFIFO_UNDERFLOW":
+            current.tx_near_underflow += 1
+
+        # FIFO_BYTES_AVAILABLE: bytes in the RX FIFO for read accesses, free bytes in the TX FIFO for write accesses
+        request = protocol_msg.request
+        available = status.fifo_bytes_available
+        if request.access == "R":
+            if available < STATUS_FIFO_BYTES_MAX:
+                headroom = FIFO_SIZE - available
+                current.min_rx_headroom = headroom if current.min_rx_headroom is None else min(current.min_rx_headroom, headroom)
+            if request.type == ProtocolFrameType.FIFO and available <= self.underflow_margin:
+                current.rx_near_empty += 1
+        else:
+            current.min_tx_headroom = available if current.min_tx_headroom is None else min(current.min_tx_headroom, available)
+            if request.type == ProtocolFrameType.FIFO and available <= self.overflow_margin:
+                current.tx_near_full += 1
+
+        response = protocol_msg.response
+        if response is None or not response.data:
+            return
+        register = request.register
+        if register == "RXBYTES":
+            # RXFIFO_OVERFLOW[7], NUM_RXBYTES[6:0]
+            headroom = max(FIFO_SIZE - (response.data[0] & 0x7F), 0)
+            current.min_rx_headroom = headroom if current.min_rx_headroom is None else min(current.min_rx_headroom, headroom)
+            if (response.data[0] & 0x80) == 0 and headroom <= self.overflow_margin:
+                current.rx_near_overflow += 1
+        elif register == "TXBYTES":
+            # TXFIFO_UNDERFLOW[7], NUM_TXBYTES[6:0]
+            fill = response.data[0] & 0x7F
+            if state == "TX":
+                current.min_tx_bytes = fill if current.min_tx_bytes is None else min(current.min_tx_bytes, fill)
+                if (response.data[0] & 0x80) == 0 and fill <= self.underflow_margin:
+                    current.tx_near_underflow += 1
+
+    def close_window(self):
+        current = self.current
+        if current.transactions > 0:
+            summary = WindowSummary(
+                self.window_start,
+                self.window_start + self.window,
+                current.transactions,
+                current.bytes,
+                current.bytes / self.window,
+                current.transactions / self.window,
+                min(current.active_time / self.window, 1.0),
+                current.min_gap,
+                current.max_gap,
+                current.min_rx_headroom,
+                current.min_tx_bytes,
+                current.min_tx_headroom,
+                current.rx_near_overflow,
+                current.tx_near_full,
+                current.rx_near_empty,
+                current.tx_near_underflow,
+            )
+            self.windows.append(summary)
+            if self.on_window is not None:
+                self.on_window(summary)
+        self.current = WindowAccumulator()
+
+    def flush(self):
+        '''
+        Close the last (partial) window at the end of a capture.
+        '''
+        self.close_window()
+        self.window_start += self.window
+
+    def report(self):
+        '''
+        Text report over the whole capture.
+        '''
+        span = self.last_end if self.transactions else 0.0
+        lines = [
+            "Transactions:          {}".format(self.transactions),
+            "Bytes:                 {}".format(self.bytes),
+            "Duration:              {:.6f} s".format(span),
+            "Throughput:            {:.0f} bytes/s, {:.0f} transactions/s".format(
+                self.bytes / span if span else 0.0, self.transactions / span if span else 0.0),
+            "CSn duty cycle:        {:.2%}".format(self.active_time / span if span else 0.0),
+            "Inter-transaction gaps:",
+        ]
+        lower = 0.0
+        for upper, count in zip(GAP_BUCKETS + (None,), self.gap_histogram):
+            if count:
+                label = "< {:g} s".format(upper) if upper is not None else ">= {:g} s".format(lower)
+                lines.append("    {:<16} {}".format(label, count))
+            lower = upper
+        lines.append("Access latency per register (mean / min / max):")
+        for register, latency in sorted(self.latency.items(), key=lambda x: -x[1].count):
+            lines.append("    {:<16} {:>8} x  {:.3e} / {:.3e} / {:.3e} s".format(
+                register, latency.count, latency.mean(), latency.min, latency.max))
+        for field, label in FIFO_WARNINGS:
+            windows = [x for x in self.windows if getattr(x, field)]
+            lines.append("{:<33}{}".format(label, ", ".join("{:.3f}s".format(x.start) for x in windows) or "none"))
+        return "\n".join(lines)
+
+def measure_capture(path, window=1.0, decoder=None):
+    '''
+    Decode an exported SPI analyzer table and return its BusMetrics.
+    '''
+    decoder = CC1101SpiDecoder() if decoder is None else decoder
+    metrics = BusMetrics(window)
+    decoder.listeners.append(metrics)
+    for _ in iter_decode_capture(path, decoder):
+        pass
+    metrics.flush()
+    return metrics
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        sys.exit("usage: python BusMetrics.py capture.csv|capture.bin [window seconds]")
+    print(measure_capture(sys.argv[1], float(sys.argv[2]) if len(sys.argv) == 3 else 1.0).report())
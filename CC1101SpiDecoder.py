@@ -0,0 +1,526 @@
+# CC1101 SPI Decoder
+# SPI frame state machine and frame data construction shared by the Logic 2 HLA and the offline decoder.
+# This module does not depend on the saleae package.
+
+from collections import OrderedDict, namedtuple
+from time import perf_counter
+from CC1101SpiProtocol import CC1101SpiProtocol, HEADER_TABLE, ProtocolFrameType, SpiByte, MARC_STATE
+
+
+class SpiFrameType:
+    error = "error"
+    enable = "enable"
+    disable = "disable"
+    result = "result"
+
+class SpiFrameState:
+    idle = 0
+    start = 1
+    active = 2
+    end = 3
+    error = 4
+    skip = 5
+
+SPI_FRAME_STATE_NAMES = ("idle", "start", "active", "end", "error", "skip")
+
+# Cached raw_data pieces per byte value: "(MOSI, " and "MISO)"
+RAW_MOSI_HEX = tuple("({:02X}, ".format(x) for x in range(256))
+RAW_MISO_HEX = tuple("{:02X})".format(x) for x in range(256))
+
+# SPI analyzer input frame, same attributes as the frames Logic 2 passes to Hla.decode
+SpiFrame = namedtuple("SpiFrame", ["type", "start_time", "end_time", "data"])
+
+# Completed CSn transaction: start of the first byte, end of the last byte, exchanged bytes (SpiByte)
+SpiTransaction = namedtuple("SpiTransaction", ["start_time", "end_time", "spi_bytes"])
+
+# Decoded output frame, same attributes as saleae.analyzers.AnalyzerFrame
+DecodedFrame = namedtuple("DecodedFrame", ["type", "start_time", "end_time", "data"])
+
+class FrameCache:
+    '''
+    Bounded LRU cache of decoded transactions, keyed on the raw (MOSI, MISO) byte tuple.
+    Polling traffic (MARCSTATE/RXBYTES/TXBYTES reads, SNOP) repeats the same few transactions;
+    only transactions up to max_length bytes are cached, long FIFO bursts rarely repeat.
+    '''
+    def __init__(self, max_size=4096, max_length=16):
+        self.max_size = max_size
+        self.max_length = max_length
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, spi_bytes):
+        if len(spi_bytes) > self.max_length:
+            return None
+        key = tuple(spi_bytes)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.entries.move_to_end(key)
+            self.hits += 1
+        return entry
+
+    def put(self, spi_bytes, entry):
+        if len(spi_bytes) > self.max_length:
+            return
+        self.entries[tuple(spi_bytes)] = entry
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+class RepeatCollapser:
+    '''
+    Merges runs of identical consecutive STATUS/COMMAND frames into one frame spanning the whole run.
+    The merged frame carries repeat_count and the min/max interval between the polls in seconds.
+    A frame that is not repeated is passed on unchanged.
+    '''
+    COLLAPSED_TYPES = (ProtocolFrameType.STATUS, ProtocolFrameType.COMMAND)
+
+    def __init__(self, make_frame):
+        self.make_frame = make_frame
+        self.pending = None
+        self.repeat_count = 0
+        self.end_time = 0
+        self.last_start_time = 0
+        self.min_interval = 0
+        self.max_interval = 0
+
+    def add(self, frame):
+        '''
+        Returns the list of completed frames (possibly empty).
+        '''
+        if self.pending is not None and frame.type == self.pending.type and frame.data == self.pending.data:
+            interval = float(frame.start_time - self.last_start_time)
+            if self.repeat_count == 1:
+                self.min_interval = self.max_interval = interval
+            else:
+                self.min_interval = min(self.min_interval, interval)
+                self.max_interval = max(self.max_interval, interval)
+            self.repeat_count += 1
+            self.last_start_time = frame.start_time
+            self.end_time = frame.end_time
+            return []
+
+        frames = self.flush()
+        if frame.type in self.COLLAPSED_TYPES:
+            self.pending = frame
+            self.repeat_count = 1
+            self.last_start_time = frame.start_time
+            self.end_time = frame.end_time
+        else:
+            frames.append(frame)
+        return frames
+
+    def flush(self):
+        '''
+        Returns the pending run as a list of at most one frame.
+        '''
+        pending = self.pending
+        self.pending = None
+        if pending is None:
+            return []
+        if self.repeat_count == 1:
+            return [pending]
+        data = dict(pending.data)
+        data["repeat_count"] = self.repeat_count
+        data["min_interval"] = self.min_interval
+        data["max_interval"] = self.max_interval
+        return [self.make_frame(pending.type, pending.start_time, self.end_time, data)]
+
+class TransactionFilter:
+    '''
+    Selects the transactions to decode by register name, frame type and access (R/W), all given criteria must match.
+    errors_only selects protocol errors (replaces frame_types). SPI errors are always passed.
+    The header byte decides, using a table precomputed for all 256 values; the frame type is checked again after
+    decoding, as a MARCSTATE read can turn out to be an error (invalid MARCSTATE).
+    '''
+    def __init__(self, registers=(), frame_types=(), access=None, errors_only=False):
+        known_registers = set(x[4] for x in HEADER_TABLE if x[4] is not None)
+        known_frame_types = set(HEADER_TABLE[x][0] for x in range(256))
+        for register in registers:
+            if register not in known_registers:
+                raise ValueError("unknown register: {}".format(register))
+        for frame_type in frame_types:
+            if frame_type not in known_frame_types:
+                raise ValueError("unknown frame type: {}".format(frame_type))
+        if access not in (None, "R", "W"):
+            raise ValueError("access must be R or W: {}".format(access))
+
+        self.registers = frozenset(registers)
+        self.frame_types = frozenset((ProtocolFrameType.ERROR,) if errors_only else frame_types)
+        self.access = access
+        self.table = bytes(self.header_matches(x) for x in range(256))
+
+    def header_matches(self, header):
+        frame_type, access, _, _, register, _, _ = HEADER_TABLE[header]
+        if self.access is not None and access != self.access:
+            return False
+        if self.registers and register not in self.registers:
+            return False
+        if self.frame_types and register == "MARCSTATE":
+            return ProtocolFrameType.STATUS in self.frame_types or ProtocolFrameType.ERROR in self.frame_types
+        return not self.frame_types or frame_type in self.frame_types
+
+    def accepts(self, frame):
+        '''
+        Check a decoded frame of a transaction whose header matched.
+        '''
+        return not self.frame_types or frame.type in self.frame_types or frame.type == "spi error"
+
+class DecoderProfile:
+    '''
+    Opt-in instrumentation of a decoder: cumulative time per stage, decoded frames per type,
+    SPI frame state machine transitions and bytes per transaction.
+    The profiled methods are wrapped on the decoder instance, a decoder without profile runs the plain methods.
+    With summary_interval > 0, frame_state_machine appends a "profile" frame after every summary_interval transactions,
+    after the pending run of the decoder's RepeatCollapser, if any.
+    '''
+    STAGES = ("frame_state_machine", "assemble", "process_frame", "construct_table")
+
+    def __init__(self, decoder, summary_interval=0):
+        self.decoder = decoder
+        self.summary_interval = summary_interval
+        self.next_summary = summary_interval
+        self.stage_times = dict.fromkeys(self.STAGES, 0.0)
+        self.stage_calls = dict.fromkeys(self.STAGES, 0)
+        self.frame_types = {}
+        self.transitions = {}
+        self.transactions = 0
+        self.bytes = 0
+        self.min_bytes = None
+        self.max_bytes = None
+
+        self.frame_state_machine = decoder.frame_state_machine
+        self.assemble = decoder.assemble
+        self.process_frame = decoder.protocol.process_frame
+        self.construct_table = decoder.construct_table
+        decoder.frame_state_machine = self.profiled_frame_state_machine
+        decoder.assemble = self.profiled_assemble
+        decoder.protocol.process_frame = self.profiled_process_frame
+        decoder.construct_table = self.profiled_construct_table
+        decoder.listeners.append(self)
+
+    def add_time(self, stage, seconds):
+        self.stage_times[stage] += seconds
+        self.stage_calls[stage] += 1
+
+    def profiled_frame_state_machine(self, frame):
+        begin = perf_counter()
+        return_frame = self.frame_state_machine(frame)
+        self.add_time("frame_state_machine", perf_counter() - begin)
+
+        if self.summary_interval > 0 and self.transactions >= self.next_summary:
+            self.next_summary = self.transactions + self.summary_interval
+            summary_frame = self.decoder.make_frame("profile", frame.end_time, frame.end_time, self.summary())
+            # Through the collapser, so a pending run of repeated frames is emitted before the summary
+            collapser = self.decoder.collapser
+            frames = [summary_frame] if collapser is None else collapser.add(summary_frame)
+            if return_frame is None:
+                return_frame = frames[0] if len(frames) == 1 else frames
+            elif type(return_frame) is list:
+                return_frame += frames
+            else:
+                return_frame = [return_frame] + frames
+        return return_frame
+
+    def profiled_assemble(self, frame):
+        previous_state = self.decoder.state
+        begin = perf_counter()
+        return_frame = self.assemble(frame)
+        self.add_time("assemble", perf_counter() - begin)
+
+        # End and error states fall back to idle within the same frame
+        state = self.decoder.state
+        if state == SpiFrameState.idle:
+            if previous_state in (SpiFrameState.active, SpiFrameState.skip) and frame.type == SpiFrameType.disable:
+                state = SpiFrameState.end
+            else:
+                state = SpiFrameState.error
+        key = (previous_state, state)
+        self.transitions[key] = self.transitions.get(key, 0) + 1
+        return return_frame
+
+    def profiled_process_frame(self, protocol_frame, time=None):
+        begin = perf_counter()
+        protocol_msg = self.process_frame(protocol_frame, time)
+        self.add_time("process_frame", perf_counter() - begin)
+        return protocol_msg
+
+    def profiled_construct_table(self, protocol_msg, spi_frame_queue):
+        begin = perf_counter()
+        result = self.construct_table(protocol_msg, spi_frame_queue)
+        self.add_time("construct_table", perf_counter() - begin)
+        return result
+
+    def add_transaction(self, transaction, protocol_msg, frame):
+        size = len(transaction.spi_bytes)
+        self.transactions += 1
+        self.bytes += size
+        self.min_bytes = size if self.min_bytes is None else min(self.min_bytes, size)
+        self.max_bytes = size if self.max_bytes is None else max(self.max_bytes, size)
+        self.frame_types[frame.type] = self.frame_types.get(frame.type, 0) + 1
+
+    def summary(self):
+        '''
+        Profile counters as frame data (numbers and strings only). Times are cumulative, in microseconds.
+        '''
+        data = {
+            "transactions":             self.transactions,
+            "bytes_per_transaction":    "{:.2f} (min {}, max {})".format(
+                self.bytes / self.transactions if self.transactions else 0.0, self.min_bytes or 0, self.max_bytes or 0),
+        }
+        for stage in self.STAGES:
+            data[stage + "_us"] = round(self.stage_times[stage] * 1e6, 1)
+            data[stage + "_calls"] = self.stage_calls[stage]
+        if self.decoder.cache is not None:
+            data["cache_hits"] = self.decoder.cache.hits
+        data["frame_types"] = ", ".join("{}: {}".format(x, y) for x, y in sorted(self.frame_types.items()))
+        data["transitions"] = ", ".join("{} -> {}: {}".format(SPI_FRAME_STATE_NAMES[x[0]], SPI_FRAME_STATE_NAMES[x[1]], y)
+                                        for x, y in sorted(self.transitions.items()))
+        return data
+
+    def report(self):
+        return "\n".join("{:<28} {}".format(x, y) for x, y in self.summary().items())
+
+class CC1101SpiDecoder:
+    def __init__(self, cache_size=4096, collapse_repeats=False, profile=False, profile_interval=0, transaction_filter=None,
+                 track_shadow=False):
+        '''
+        cache_size: number of distinct transactions kept in the FrameCache, 0 disables the cache.
+        collapse_repeats: merge identical consecutive STATUS/COMMAND frames (see RepeatCollapser).
+        transaction_filter: TransactionFilter; other transactions are skipped after the header byte, without decoding,
+        output, register shadow update or listener notification.
+        profile: collect a DecoderProfile (self.profile), emitting a "profile" frame every profile_interval transactions if > 0.
+        track_shadow: keep the time-indexed register shadow (self.protocol.shadow); its history grows with the capture.
+        '''
+        self.state = SpiFrameState.idle
+        self.spi_frame_queue = []
+        self.protocol = CC1101SpiProtocol(track_shadow)
+        self.cache = FrameCache(cache_size) if cache_size > 0 else None
+        self.collapser = RepeatCollapser(self.make_frame) if collapse_repeats else None
+        self.transaction_filter = transaction_filter
+
+        # Analysis stages fed with every decoded transaction: listener.add_transaction(transaction, protocol_msg, frame)
+        self.listeners = []
+        self.start_time = 0
+        self.end_time = 0
+        self.profile = DecoderProfile(self, profile_interval) if profile else None
+
+    def decode(self, frame):
+        '''
+        Process one SPI analyzer frame (enable/result/disable/error).
+        Returns a decoded frame when a transaction or an SPI error completes, otherwise None.
+        With collapse_repeats, a list of frames may be returned when a run of repeated frames ends.
+        '''
+        return self.frame_state_machine(frame)
+
+    def flush(self):
+        '''
+        Frames still held back at the end of a capture (pending run of repeated frames).
+        '''
+        return [] if self.collapser is None else self.collapser.flush()
+
+    def make_frame(self, frame_type, start_time, end_time, data):
+        return DecodedFrame(frame_type, start_time, end_time, data)
+
+    def frame_state_machine(self, frame):
+        return_frame = self.assemble(frame)
+        if type(return_frame) is SpiTransaction:
+            return_frame = self.decode_transaction(return_frame)
+            if self.transaction_filter is not None and not self.transaction_filter.accepts(return_frame):
+                return_frame = None
+        if self.collapser is not None and return_frame is not None:
+            frames = self.collapser.add(return_frame)
+            return_frame = None if len(frames) == 0 else frames[0] if len(frames) == 1 else frames
+        return return_frame
+
+    def decode_transaction(self, transaction):
+        return_frame = self.cached_frame(transaction)
+        if return_frame is None:
+            protocol_msg = self.protocol.process_frame(transaction.spi_bytes, transaction.end_time)
+            return_frame = self.format_transaction(transaction, protocol_msg)
+        return return_frame
+
+    def cached_frame(self, transaction):
+        '''
+        Frame of an identical, previously decoded transaction, or None.
+        The register shadow is still updated, as process_frame is skipped.
+        '''
+        entry = self.cached_entry(transaction)
+        if entry is None:
+            return None
+        protocol_msg, return_frame = entry
+        self.notify(transaction, protocol_msg, return_frame)
+        return return_frame
+
+    def cached_entry(self, transaction):
+        '''
+        (ProtocolMessage, frame) of an identical, previously decoded transaction, or None. Listeners are not notified.
+        '''
+        if self.cache is None:
+            return None
+        entry = self.cache.get(transaction.spi_bytes)
+        if entry is None:
+            return None
+        frame_type, frame_data, protocol_msg = entry
+        if self.protocol.shadow is not None:
+            self.protocol.shadow.update(protocol_msg, transaction.end_time)
+        return protocol_msg, self.make_frame(frame_type, transaction.start_time, transaction.end_time, dict(frame_data))
+
+    def notify(self, transaction, protocol_msg, frame):
+        for listener in self.listeners:
+            listener.add_transaction(transaction, protocol_msg, frame)
+
+    def format_transaction(self, transaction, protocol_msg):
+        frame_type, frame_data = self.construct_table(protocol_msg, transaction.spi_bytes)
+        if self.cache is not None:
+            self.cache.put(transaction.spi_bytes, (frame_type, dict(frame_data), protocol_msg))
+        return_frame = self.make_frame(frame_type, transaction.start_time, transaction.end_time, frame_data)
+        self.notify(transaction, protocol_msg, return_frame)
+        return return_frame
+
+    def assemble(self, frame):
+        '''
+        Run the SPI frame state machine on one SPI analyzer frame.
+        Returns a SpiTransaction when CSn goes high after at least one byte, an "spi error" frame, or None.
+        '''
+        return_frame = None
+
+        # Check for error frames
+        if frame.type == SpiFrameType.error:
+            self.state = SpiFrameState.error
+            return_frame = self.make_frame("spi error", frame.start_time, frame.end_time, {"error_details": "clock in wrong state when enable signal became active"})
+
+        # Check Idle state
+        if self.state == SpiFrameState.idle:
+            if frame.type == SpiFrameType.enable:
+                self.start_time = frame.start_time  # Log start time
+                self.state = SpiFrameState.start
+            else:
+                self.state = SpiFrameState.error
+
+        # Check Start state
+        elif self.state == SpiFrameState.start:
+            if frame.type == SpiFrameType.result:
+                self.start_time = frame.start_time  # Log start time
+                self.end_time = frame.end_time      # Log end time
+                self.state = SpiFrameState.active
+                if self.transaction_filter is not None and not self.transaction_filter.table[self.from_byte(frame.data["mosi"])]:
+                    self.state = SpiFrameState.skip
+            elif frame.type == SpiFrameType.disable:
+                self.end_time = frame.end_time      # Log end time
+                self.state = SpiFrameState.error
+                return_frame = self.make_frame("spi error", self.start_time, self.end_time, {"error_details": "no SPI frame"})
+            else:
+                self.state = SpiFrameState.error
+
+        # Check Active state
+        elif self.state == SpiFrameState.active:
+            if frame.type == SpiFrameType.disable:
+                self.state = SpiFrameState.end
+            elif frame.type == SpiFrameType.result:
+                self.end_time = frame.end_time      # Log end time
+            else:
+                self.state = SpiFrameState.error
+
+        # Check Skip state (transaction not selected by the filter)
+        elif self.state == SpiFrameState.skip:
+            if frame.type == SpiFrameType.disable:
+                self.state = SpiFrameState.idle
+            elif frame.type != SpiFrameType.result:
+                self.state = SpiFrameState.error
+
+        # Execute Active state
+        if self.state == SpiFrameState.active:
+            self.spi_frame_queue.append(self.get_spi_data_frame(frame))
+
+        # Execute End state
+        if self.state == SpiFrameState.end:
+            if len(self.spi_frame_queue) > 0:
+                # Hand the queue over to the transaction, it may be decoded later
+                return_frame = SpiTransaction(self.start_time, self.end_time, self.spi_frame_queue)
+                self.spi_frame_queue = []
+
+            # Automatic transition
+            self.state = SpiFrameState.idle
+
+        # Execute Error state
+        elif self.state == SpiFrameState.error:
+            # Drop the bytes of an aborted transaction
+            self.spi_frame_queue.clear()
+
+            # Automatic transition
+            self.state = SpiFrameState.idle
+
+        return return_frame
+
+    def construct_table(self, protocol_msg, spi_frame_queue):
+        request              = protocol_msg.request
+        response             = protocol_msg.response
+        frame_type           = request.type
+        access               = request.access
+        burst                = request.burst
+        register             = request.register
+        write_data           = "" if request.data is None else request.data.hex(" ").upper()
+        chip_ready           = "" if response is None else "OK" if response.status.chip_rdy else "NOT RDY"
+        state                = "" if response is None else response.status.state
+        fifo_bytes_available = "" if response is None else "{}".format(response.status.fifo_bytes_available)
+        read_data            = "" if response is None else response.data.hex(" ").upper()
+        description          = request.description
+        focus_data           = ""
+        error_details        = ""
+
+        # Focus Data is used mainly for the Protocol UI labels
+        if frame_type == ProtocolFrameType.ERROR:
+            error_details = request.error
+        elif frame_type == ProtocolFrameType.REGISTER:
+            focus_data = write_data if access == "W" else read_data
+        elif frame_type == ProtocolFrameType.COMMAND:
+            pass
+        elif frame_type == ProtocolFrameType.STATUS:
+            if register == "MARCSTATE" and response.data:
+                marc_state = response.data[0]
+                if marc_state <= 0x16:
+                    focus_data = MARC_STATE[marc_state]["state"]
+                else:
+                    # See [SWRZ020E] CC1101 Silicon Errata
+                    frame_type = ProtocolFrameType.ERROR
+                    error_details = "Invalid MARCSTATE"
+            else:
+                focus_data = read_data
+        elif frame_type == ProtocolFrameType.PA_TABLE:
+            focus_data = write_data if access == "W" else read_data
+        elif frame_type == ProtocolFrameType.FIFO:
+            focus_data = write_data if access == "W" else read_data
+
+        return (
+            frame_type,
+            {
+                "raw_data":             self.raw_data(spi_frame_queue),
+                "access":               access,
+                "burst":                burst,
+                "register":             register,
+                "write_data":           write_data,
+                "chip_ready":           chip_ready,
+                "state":                state,
+                "fifo_bytes_available": fifo_bytes_available,
+                "read_data":            read_data,
+                "register_description": description,
+                "focus_data":           focus_data,
+                "error_details":        error_details,
+            }
+        )
+
+    def from_byte(self, data_raw):
+        return int.from_bytes(data_raw, "big")
+
+    def get_spi_data_frame(self, frame):
+        return SpiByte(self.from_byte(frame.data["mosi"]), self.from_byte(frame.data["miso"]))
+
+    def raw_data(self, spi_frame_queue):
+        return "[" + " ".join([RAW_MOSI_HEX[mosi] + RAW_MISO_HEX[miso] for mosi, miso in spi_frame_queue]) + "]"
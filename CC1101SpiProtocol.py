@@ -1,5 +1,6 @@
 
-from copy import deepcopy
+from bisect import bisect_right
+from collections import deque, namedtuple
 
 
 # Table 43: Configuration Registers Overview
@@ -53,6 +54,19 @@ CONFIG_REGISTERS = {
     0x2E: {"register": "TEST0",                 "description": "Various test settings"}
 }
 
+# Configuration register reset values (Section 29: Configuration Registers)
+CONFIG_REGISTER_DEFAULTS = {
+    0x00: 0x29, 0x01: 0x2E, 0x02: 0x3F, 0x03: 0x07, 0x04: 0xD3, 0x05: 0x91, 0x06: 0xFF, 0x07: 0x04,
+    0x08: 0x45, 0x09: 0x00, 0x0A: 0x00, 0x0B: 0x0F, 0x0C: 0x00, 0x0D: 0x1E, 0x0E: 0xC4, 0x0F: 0xEC,
+    0x10: 0x8C, 0x11: 0x22, 0x12: 0x02, 0x13: 0x22, 0x14: 0xF8, 0x15: 0x47, 0x16: 0x07, 0x17: 0x30,
+    0x18: 0x04, 0x19: 0x36, 0x1A: 0x6C, 0x1B: 0x03, 0x1C: 0x40, 0x1D: 0x91, 0x1E: 0x87, 0x1F: 0x6B,
+    0x20: 0xF8, 0x21: 0x56, 0x22: 0x10, 0x23: 0xA9, 0x24: 0x0A, 0x25: 0x20, 0x26: 0x0D, 0x27: 0x41,
+    0x28: 0x00, 0x29: 0x59, 0x2A: 0x7F, 0x2B: 0x3F, 0x2C: 0x88, 0x2D: 0x31, 0x2E: 0x0B,
+}
+
+# PATABLE reset values (Section 24: Output Power Programming)
+PA_TABLE_DEFAULTS = (0xC6, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00)
+
 # Table 42: Command Strobes
 COMMAND_REGISTERS = {
     0x30: {"register": "SRES",                  "description": "Reset chip."},
@@ -118,6 +132,8 @@ MARC_STATE = {
     0x16: {"state_name": "TXFIFO_UNDERFLOW",    "state": "TXFIFO_UNDERFLOW"},
 }
 
+CONFIG_ADDRESSES = {x["register"]: address for address, x in CONFIG_REGISTERS.items()}
+
 MULTI_BYTE_REGISTERS = {
     0x3E: {"register": "PATABLE",               "description": "PA Table"},
     0x3F: {"register": "TX/RX FIFO",            "description": "Tx / Rx FIFO"},
@@ -153,54 +169,234 @@ class ProtocolFrameType:
     FIFO = "fifo"
     ERROR = "protocol error"
 
-class CC1101SpiProtocol:
-    PROTOCOL_MSG = {
-        "request": None,
-        "response": None,
-    }
-    REQUEST = {
-        "type": None,
-        "access": None,
-        "burst": None,
-        "register": None,
-        "data": None,
-        "description": None,
-        "error": None,
-    }
-    RESPONSE = {
-        "status": None,
-        "data": None,
-        "error": None,
-    }
-    STATUS = {
-        "chip_rdy": None,
-        "state": None,
-        "fifo_bytes_available": None,
-    }
+# One SPI byte exchange
+SpiByte = namedtuple("SpiByte", ["mosi", "miso"])
+
+# Decoded status byte, shared from STATUS_TABLE
+Status = namedtuple("Status", ["chip_rdy", "state", "fifo_bytes_available"])
+
+class Request:
+    __slots__ = ("type", "access", "burst", "address", "register", "description", "error", "data")
+
+    def __init__(self, type, access, burst, address, register, description, error, data=None):
+        self.type = type
+        self.access = access
+        self.burst = burst
+        self.address = address
+        self.register = register
+        self.description = description
+        self.error = error
+        self.data = data
+
+class Response:
+    __slots__ = ("status", "data", "error")
+
+    def __init__(self, status, data, error=None):
+        self.status = status
+        self.data = data
+        self.error = error
+
+class ProtocolMessage:
+    __slots__ = ("request", "response")
+
+    def __init__(self, request=None, response=None):
+        self.request = request
+        self.response = response
+
+def decode_header_byte(data_byte):
+    '''
+    Decode the first MOSI byte of a transaction (R/W bit, burst bit, 6-bit address).
+    Returns (frame_type, access, burst, address, register, description, error).
+    '''
+    access = "R" if (data_byte & 0x80) != 0 else "W"
+    burst = "B" if (data_byte & 0x40) != 0 else ""
+    address = data_byte & 0x3F
+    register = None
+    error = None
+
+    if address in CONFIG_REGISTERS:
+        frame_type = ProtocolFrameType.REGISTER
+        register = CONFIG_REGISTERS[address]
+    elif address == 0x3E:
+        frame_type = ProtocolFrameType.PA_TABLE
+        register = MULTI_BYTE_REGISTERS[address]
+    elif address == 0x3F:
+        frame_type = ProtocolFrameType.FIFO
+        register = MULTI_BYTE_REGISTERS[address]
+    elif access == "R" and burst and address in STATUS_REGISTERS:
+        frame_type = ProtocolFrameType.STATUS
+        register = STATUS_REGISTERS[address]
+    elif address in COMMAND_REGISTERS:
+        frame_type = ProtocolFrameType.COMMAND
+        register = COMMAND_REGISTERS[address]
+    elif address == 0x37:
+        frame_type = ProtocolFrameType.ERROR
+        error = "Invalid COMMAND"
+    else:
+        frame_type = ProtocolFrameType.ERROR
+        error = "Invalid ADDRESS"
+
+    if register is None:
+        return frame_type, access, burst, address, None, None, error
+    return frame_type, access, burst, address, register["register"], register["description"], error
+
+def decode_status_byte(status_byte):
+    '''
+    Decode a chip status byte (Table 23).
+    '''
+    chip_rdy = False if (status_byte & 0x80) != 0 else True
+    state = STATE_BITS[(status_byte & 0x70) >> 4]["state"]
+    return Status(chip_rdy, state, (status_byte & 0x0F))
+
+# Every possible header byte and status byte decoded once at import time
+HEADER_TABLE = tuple(decode_header_byte(x) for x in range(256))
+STATUS_TABLE = tuple(decode_status_byte(x) for x in range(256))
+
+
+# Shadow register read that did not match the expected value
+ShadowMismatch = namedtuple("ShadowMismatch", ["time", "register", "expected", "actual"])
+
+class ShadowRegisters:
+    '''
+    Shadow copy of the configuration registers and the 8-byte PATABLE, updated incrementally from decoded transactions.
+    Every value change is stored with its time, so the value at a point in time is found by binary search (O(log n)).
+    '''
+    MAX_MISMATCHES = 1000
 
     def __init__(self):
-        pass
+        self.registers = bytearray(CONFIG_REGISTER_DEFAULTS[x] for x in range(len(CONFIG_REGISTER_DEFAULTS)))
+        self.pa_table = bytearray(PA_TABLE_DEFAULTS)
+
+        # Change history per register name ("PATABLE[n]" for the PATABLE entries), sorted by time
+        self.history_times = {}
+        self.history_values = {}
+
+        # Reads that differed from the shadow value (most recent MAX_MISMATCHES)
+        self.mismatch_count = 0
+        self.mismatches = deque(maxlen=self.MAX_MISMATCHES)
+
+    def update(self, protocol_msg, time):
+        request = protocol_msg.request
+        if request.type == ProtocolFrameType.REGISTER:
+            if request.access == "W":
+                if request.data is not None:
+                    self.write_registers(request.address, request.data if request.burst else request.data[:1], time)
+            elif protocol_msg.response is not None:
+                data = protocol_msg.response.data
+                self.read_registers(request.address, data if request.burst else data[:1], time)
+        elif request.type == ProtocolFrameType.PA_TABLE:
+            if request.access == "W":
+                if request.data is not None:
+                    self.write_pa_table(request.data if request.burst else request.data[:1], time)
+            elif protocol_msg.response is not None:
+                data = protocol_msg.response.data
+                self.read_pa_table(data if request.burst else data[:1], time)
+        elif request.type == ProtocolFrameType.COMMAND and request.register == "SRES":
+            self.reset(time)
+
+    def write_registers(self, address, data, time):
+        # Burst access auto-increments the address; writes past the last configuration register are ignored
+        for offset, value in enumerate(data[:len(self.registers) - address]):
+            self.set_register(address + offset, value, time)
+
+    def read_registers(self, address, data, time):
+        for offset, value in enumerate(data[:len(self.registers) - address]):
+            if self.registers[address + offset] != value:
+                self.record_mismatch(CONFIG_REGISTERS[address + offset]["register"], self.registers[address + offset], value, time)
+                self.set_register(address + offset, value, time)
+
+    def write_pa_table(self, data, time):
+        # The PATABLE index counter starts at 0 for every transaction and wraps around after index 7
+        for index, value in enumerate(data):
+            self.set_pa_table(index % len(self.pa_table), value, time)
+
+    def read_pa_table(self, data, time):
+        for index, value in enumerate(data):
+            index %= len(self.pa_table)
+            if self.pa_table[index] != value:
+                self.record_mismatch("PATABLE[{}]".format(index), self.pa_table[index], value, time)
+                self.set_pa_table(index, value, time)
+
+    def reset(self, time):
+        # SRES: all registers back to their reset values
+        for address, value in CONFIG_REGISTER_DEFAULTS.items():
+            self.set_register(address, value, time)
+        for index, value in enumerate(PA_TABLE_DEFAULTS):
+            self.set_pa_table(index, value, time)
+
+    def set_register(self, address, value, time):
+        if self.registers[address] != value:
+            self.registers[address] = value
+            self.record_change(CONFIG_REGISTERS[address]["register"], value, time)
+
+    def set_pa_table(self, index, value, time):
+        if self.pa_table[index] != value:
+            self.pa_table[index] = value
+            self.record_change("PATABLE[{}]".format(index), value, time)
+
+    def record_change(self, name, value, time):
+        # Transactions decoded without a time (process_frame(protocol_frame)) update the shadow, but not the history
+        if time is None:
+            return
+        if name not in self.history_times:
+            self.history_times[name] = []
+            self.history_values[name] = []
+        self.history_times[name].append(time)
+        self.history_values[name].append(value)
+
+    def record_mismatch(self, name, expected, actual, time):
+        self.mismatch_count += 1
+        self.mismatches.append(ShadowMismatch(time, name, expected, actual))
+
+    def value_at(self, name, time):
+        '''
+        Value of a configuration register (e.g. "FREQ2") or PATABLE entry (e.g. "PATABLE[0]") at the given time.
+        '''
+        times = self.history_times.get(name)
+        index = 0 if times is None else bisect_right(times, time)
+        if index > 0:
+            return self.history_values[name][index - 1]
+        if name.startswith("PATABLE["):
+            return PA_TABLE_DEFAULTS[int(name[8:-1])]
+        return CONFIG_REGISTER_DEFAULTS[CONFIG_ADDRESSES[name]]
+
+    def snapshot_at(self, time):
+        '''
+        All configuration register values at the given time, by register name.
+        '''
+        return {x["register"]: self.value_at(x["register"], time) for x in CONFIG_REGISTERS.values()}
+
+    def pa_table_at(self, time):
+        return bytes(self.value_at("PATABLE[{}]".format(x), time) for x in range(len(self.pa_table)))
+
+class CC1101SpiProtocol:
+    def __init__(self, track_shadow=False):
+        self.shadow = ShadowRegisters() if track_shadow else None
 
-    def process_frame(self, protocol_frame):
-        protocol_msg = deepcopy(self.PROTOCOL_MSG)
+    def process_frame(self, protocol_frame, time=None):
+        protocol_msg = ProtocolMessage()
 
         if len(protocol_frame) > 0:
             # Interpret Request
-            protocol_msg["request"] = self.interpret_request(self.get_mosi_data(protocol_frame))
+            protocol_msg.request = self.interpret_request(self.get_mosi_data(protocol_frame))
 
             if self.is_read_access(protocol_frame):
                 # Interpret Response
-                protocol_msg["response"] = self.interpret_response(self.get_miso_data(protocol_frame))
+                protocol_msg.response = self.interpret_response(self.get_miso_data(protocol_frame))
+
+            # Track register contents
+            if self.shadow is not None:
+                self.shadow.update(protocol_msg, time)
         return protocol_msg
 
     def is_read_access(self, protocol_frame):
-        return (protocol_frame[0]["mosi"] & 0x80) != 0
+        return (protocol_frame[0].mosi & 0x80) != 0
 
     def get_mosi_data(self, protocol_frame):
-        return [x["mosi"] for x in protocol_frame]
+        return bytes([x.mosi for x in protocol_frame])
 
     def get_miso_data(self, protocol_frame):
-        return [x["miso"] for x in protocol_frame]
+        return bytes([x.miso for x in protocol_frame])
 
     def is_read(self, data_byte):
         return True if (data_byte & 0x80) != 0 else False
@@ -212,66 +408,16 @@ class CC1101SpiProtocol:
         return True if (data_byte & 0x40) != 0 else False
 
     def interpret_register(self, data_byte):
-        register = None
-        address = data_byte & 0x3F
-        frame_type = None
-        error = None
-
-        if address < 0x30:
-            frame_type = ProtocolFrameType.REGISTER
-            register = CONFIG_REGISTERS[address]
-        elif address == 0x3E:
-            frame_type = ProtocolFrameType.PA_TABLE
-            register = MULTI_BYTE_REGISTERS[address]
-        elif address == 0x3F:
-            frame_type = ProtocolFrameType.FIFO
-            register = MULTI_BYTE_REGISTERS[address]
-        elif self.is_read(data_byte) and self.is_burst(data_byte):
-            frame_type = ProtocolFrameType.STATUS
-            register = STATUS_REGISTERS[address]
-        elif address <= 0x3D:
-            if address != 0x37:
-                frame_type = ProtocolFrameType.COMMAND
-                register = COMMAND_REGISTERS[address]
-            else:
-                frame_type = ProtocolFrameType.ERROR
-                error = "Invalid COMMAND"
-        elif address > 0x3D:
-            frame_type = ProtocolFrameType.ERROR
-            error = "Invalid ADDRESS"
-
-        return frame_type, register["register"], register["description"], error
+        frame_type, _, _, _, register, description, error = HEADER_TABLE[data_byte]
+        return frame_type, register, description, error
 
     def interpret_request(self, data):
-        request = deepcopy(self.REQUEST)
-
-        # Access mode
-        request["access"] = "W" if self.is_write(data[0]) else "R"
-        request["burst"] = "B" if self.is_burst(data[0]) else ""
-
-        # Register address
-        request["type"], request["register"], request["description"], request["error"] = self.interpret_register(data[0])
-
-        # Data Byte
-        if len(data) > 1:
-            request["data"] = data[1:]
-
-        return request
+        # Access mode, register address and data bytes
+        return Request(*HEADER_TABLE[data[0]], data[1:] if len(data) > 1 else None)
 
     def interpret_status(self, status_byte):
-        status = deepcopy(self.STATUS)
-        status["chip_rdy"] = False if (status_byte & 0x80) != 0 else True
-        status["state"] = STATE_BITS[(status_byte & 0x70) >> 4]["state"]
-        status["fifo_bytes_available"] = (status_byte & 0x0F)
-        return status
+        return STATUS_TABLE[status_byte]
 
     def interpret_response(self, data):
-        response = deepcopy(self.RESPONSE)
-
-        # Status Byte
-        response["status"] = self.interpret_status(data[0])
-
-        # Data byte
-        response["data"] = data[1:]
-
-        return response
+        # Status byte and data bytes
+        return Response(STATUS_TABLE[data[0]], data[1:])
@@ -0,0 +1,442 @@
+# Consistency checks
+# Run from the extension folder: python Checks.py
+#
+# Decodes seeded synthetic traffic (TrafficGenerator) through the decoder variants and compares their output.
+# Exits with status 1 if a check fails.
+
+import hashlib
+import io
+import os
+import sys
+import tempfile
+from CC1101SpiDecoder import CC1101SpiDecoder, SpiFrame, SpiFrameType, SpiTransaction, TransactionFilter
+from OfflineDecoder import decode_capture, decode_frames, iter_decode_frames, write_binary, write_csv
+from TrafficGenerator import DEFAULT_MIX, TrafficGenerator
+
+
+SEED = 1
+TRANSACTIONS = 5000
+
+# Mix with a large share of CSn sequences the SPI frame state machine rejects
+MALFORMED_MIX = dict(DEFAULT_MIX, **{"malformed csn": 40})
+
+# SHA-256 of the decoded table (OfflineDecoder.write_csv) of TrafficGenerator(SEED).frames(TRANSACTIONS).
+# Where the original HLA could decode the traffic (it raised on invalid headers and truncated reads), the output is
+# the same, except that bytes of a transaction aborted by a second enable no longer leak into the next one.
+DECODED_DIGEST = "1bc15878e3889d3bb3075a63687deca3e203d50035c95acd91f2fd0e42af85a0"
+
+
+class CheckSkipped(Exception):
+    pass
+
+def traffic(seed=SEED, transactions=TRANSACTIONS, mix=None):
+    return list(TrafficGenerator(seed, mix).frames(transactions))
+
+def polling_traffic(runs=100, run_length=20, start_time=0.0):
+    '''
+    Runs of identical MARCSTATE polls, each followed by a random transaction, for the RepeatCollapser.
+    '''
+    generator = TrafficGenerator(SEED)
+    frames = []
+    time = start_time
+    for _ in range(runs):
+        for _ in range(run_length):
+            frames += generator.transaction_frames(time, [0xF5, 0x00], [0x1F, 0x0D])
+            time = frames[-1].end_time + generator.random.uniform(*generator.gap_range)
+        frames += generator.frames(1, time)
+        time = frames[-1].end_time + generator.random.uniform(*generator.gap_range)
+    return frames
+
+def frame_tuples(frames):
+    return [(x.type, x.start_time, x.end_time, x.data) for x in frames]
+
+def digest(frames):
+    output = io.StringIO()
+    write_csv(output, [frames])
+    return hashlib.sha256(output.getvalue().encode("utf-8")).hexdigest()
+
+def message_fields(protocol_msg):
+    request = protocol_msg.request
+    response = protocol_msg.response
+    return (
+        tuple(getattr(request, x) for x in request.__slots__),
+        None if response is None else tuple(getattr(response, x) for x in response.__slots__),
+    )
+
+def temporary_binary(frames):
+    '''
+    Path of a temporary OfflineDecoder binary table of the frames; the caller removes it.
+    '''
+    binary_file, path = tempfile.mkstemp(suffix=".bin")
+    os.close(binary_file)
+    write_binary(path, frames)
+    return path
+
+def make_hla():
+    '''
+    The Logic 2 HLA if the saleae package is installed, otherwise None.
+    '''
+    try:
+        from HighLevelAnalyzer import Hla
+    except ImportError:
+        return None
+    return Hla()
+
+def check_hla():
+    '''
+    Frame by frame decoding (as in Logic 2) equals the offline pipeline, and the decoded table is unchanged.
+    '''
+    frames = traffic()
+    expected = decode_frames(frames)
+    for decoder in (CC1101SpiDecoder(), make_hla()):
+        if decoder is None:
+            continue
+        decoded = []
+        for frame in frames:
+            return_frame = decoder.decode(frame)
+            if return_frame is not None:
+                decoded += return_frame if type(return_frame) is list else [return_frame]
+        decoded += decoder.flush()
+        if frame_tuples(decoded) != frame_tuples(expected):
+            return "{}.decode differs from OfflineDecoder.decode_frames".format(type(decoder).__name__)
+    if digest(expected) != DECODED_DIGEST:
+        return "decoded table changed: {}".format(digest(expected))
+    return None
+
+def check_vector():
+    '''
+    VectorDecoder decodes the same transactions as the SPI frame state machine, also on malformed CSn sequences.
+    '''
+    try:
+        import VectorDecoder
+    except ImportError:
+        raise CheckSkipped("numpy not installed")
+    for mix in (None, MALFORMED_MIX):
+        frames = traffic(mix=mix)
+        decoder = CC1101SpiDecoder()
+        expected = [x for x in map(decoder.assemble, frames) if type(x) is SpiTransaction]
+        path = temporary_binary(frames)
+        try:
+            transactions = VectorDecoder.decode_arrays(*VectorDecoder.read_binary_arrays(path))
+        finally:
+            os.remove(path)
+        if len(transactions) != len(expected):
+            return "{} transactions instead of {}".format(len(transactions), len(expected))
+        for index, transaction in enumerate(expected):
+            offset = transactions.offset[index]
+            mosi = transactions.mosi[offset:offset + transactions.length[index]].tobytes()
+            if (
+                transactions.start_time[index] != transaction.start_time
+                or transactions.end_time[index] != transaction.end_time
+                or mosi != bytes(x.mosi for x in transaction.spi_bytes)
+                or message_fields(transactions.message(index)) != message_fields(decoder.protocol.process_frame(transaction.spi_bytes))
+            ):
+                return "transaction {} at {} differs".format(index, transaction.start_time)
+    return None
+
+def check_parallel():
+    '''
+    ParallelDecoder returns the same frames as a serial decode, whatever the shard edges.
+    '''
+    from ParallelDecoder import decode_capture_parallel
+    for mix in (None, MALFORMED_MIX):
+        path = temporary_binary(traffic(mix=mix))
+        try:
+            for collapse_repeats in (False, True):
+                expected = frame_tuples(decode_capture(path, CC1101SpiDecoder(collapse_repeats=collapse_repeats)))
+                for shard_size in (1000, 4099, 1 << 18):
+                    decoded = decode_capture_parallel(path, 2, shard_size, collapse_repeats)
+                    if frame_tuples(decoded) != expected:
+                        return "shard size {} (collapse_repeats={}) differs from decode_capture".format(shard_size, collapse_repeats)
+        finally:
+            os.remove(path)
+    return None
+
+class TransactionLog:
+    '''
+    Decoder listener recording every notified transaction with its frame.
+    '''
+    def __init__(self):
+        self.entries = []
+
+    def add_transaction(self, transaction, protocol_msg, frame):
+        self.entries.append((transaction, frame.type, frame.start_time, frame.end_time, frame.data))
+
+def check_cache():
+    '''
+    The FrameCache does not change the decoded frames or the listener notifications, also when it evicts entries.
+    '''
+    # The same 40 transactions between random ones, so that the cache hits and evicts
+    frames = []
+    for seed in range(SEED + 1, SEED + 1 + TRANSACTIONS // 80):
+        frames += TrafficGenerator(SEED).frames(40, frames[-1].end_time if frames else 0.0)
+        frames += TrafficGenerator(seed).frames(40, frames[-1].end_time)
+    results = []
+    for cache_size in (0, 128, 4096):
+        decoder = CC1101SpiDecoder(cache_size=cache_size)
+        log = TransactionLog()
+        decoder.listeners.append(log)
+        results.append((cache_size, frame_tuples(decode_frames(frames, decoder)), log.entries))
+    for cache_size, decoded, entries in results[1:]:
+        if decoded != results[0][1]:
+            return "cache size {}: decoded frames differ from an uncached decode".format(cache_size)
+        if entries != results[0][2]:
+            return "cache size {}: listener notifications differ from an uncached decode".format(cache_size)
+    return None
+
+def check_store():
+    '''
+    TransactionStore stores the frames of decode_capture, with a transaction filter and collapsed runs too.
+    '''
+    from TransactionStore import TransactionStoreReader, store_capture
+    path = temporary_binary(traffic() + polling_traffic(start_time=1.0))
+    store_path = path + ".cc1101"
+    try:
+        for make_decoder in (
+                lambda: CC1101SpiDecoder(),
+                lambda: CC1101SpiDecoder(collapse_repeats=True),
+                lambda: CC1101SpiDecoder(collapse_repeats=True, transaction_filter=TransactionFilter(frame_types=("status", "cmd")))):
+            expected = [
+                (x.type, x.start_time, x.end_time, x.data.get("register") or "",
+                 x.data.get("repeat_count", 1), x.data.get("min_interval", 0.0), x.data.get("max_interval", 0.0))
+                for x in decode_capture(path, make_decoder())
+            ]
+            count = store_capture(path, store_path, make_decoder())
+            with TransactionStoreReader(store_path) as reader:
+                stored = [(x.type, x.start_time, x.end_time, x.register, x.repeat_count, x.min_interval, x.max_interval) for x in reader]
+            if count != len(expected) or stored != expected:
+                return "stored transactions differ from decode_capture"
+            if sum(x[4] for x in stored) != len(decode_capture(path, CC1101SpiDecoder(transaction_filter=make_decoder().transaction_filter))):
+                return "repeat counts do not add up to the stored transactions"
+    finally:
+        os.remove(path)
+        if os.path.exists(store_path):
+            os.remove(store_path)
+    return None
+
+# TransactionFilter arguments: registers, frame types, access, errors only
+FILTERS = (
+    (("MARCSTATE", "TX/RX FIFO"), (), None, False),
+    ((), ("fifo", "status"), None, False),
+    ((), (), "R", False),
+    ((), ("register", "cmd"), "W", False),
+    (("SIDLE", "FREQ2", "PATABLE"), (), "W", False),
+    ((), (), None, True),
+)
+
+def selected(frame, registers, frame_types, access, errors_only):
+    '''
+    The TransactionFilter criteria applied to a decoded frame.
+    '''
+    if frame.type == "spi error":
+        return True
+    frame_types = ("protocol error",) if errors_only else frame_types
+    return (
+        (not registers or frame.data.get("register") in registers)
+        and (access is None or frame.data.get("access") == access)
+        and (not frame_types or frame.type in frame_types)
+    )
+
+def check_filter():
+    '''
+    Decoding with a TransactionFilter equals the unfiltered decode filtered afterwards.
+    '''
+    # A MOSI value exported as empty is decoded as 0x00
+    frames = [
+        SpiFrame(SpiFrameType.enable, 0.0, 0.0, {}),
+        SpiFrame(SpiFrameType.result, 0.0, 1e-6, {"mosi": b"", "miso": b""}),
+        SpiFrame(SpiFrameType.disable, 1e-6, 1e-6, {}),
+    ]
+    frames += TrafficGenerator(SEED, MALFORMED_MIX).frames(TRANSACTIONS, 1e-5)
+    decoded = decode_frames(frames)
+    for criteria in FILTERS:
+        expected = [x for x in decoded if selected(x, *criteria)]
+        filtered = decode_frames(frames, CC1101SpiDecoder(transaction_filter=TransactionFilter(*criteria)))
+        if frame_tuples(filtered) != frame_tuples(expected):
+            return "filter {} differs from the filtered decode".format(criteria)
+    return None
+
+def hand_built(transactions):
+    '''
+    SPI analyzer frames of (start time, mosi, miso) transactions, 1 us per byte.
+    '''
+    generator = TrafficGenerator()
+    return [x for time, mosi, miso in transactions for x in generator.transaction_frames(time, mosi, miso)]
+
+def check_bus_metrics():
+    '''
+    BusMetrics window totals, gap histogram, FIFO headroom and FIFO warnings of a hand-built capture.
+    '''
+    from BusMetrics import BusMetrics
+    frames = hand_built([
+        # Window 0: SNOP, RXBYTES = 62 (2 bytes headroom), RX FIFO read with 3 bytes available
+        (0.0,       [0xBD],             [0x0F]),
+        (10e-6,     [0xFB, 0x00],       [0x1F, 0x3E]),
+        (20e-6,     [0xFF, 0x00, 0x00], [0x13, 0x55, 0xAA]),
+        # Window 1: TX FIFO write with 2 bytes free, TXBYTES = 3 in TX
+        (1.5e-3,    [0x7F, 0x01, 0x02], [0x22, 0x2F, 0x2F]),
+        (1.6e-3,    [0xFA, 0x00],       [0x2F, 0x03]),
+    ])
+    metrics = BusMetrics(window=1e-3)
+    decoder = CC1101SpiDecoder()
+    decoder.listeners.append(metrics)
+    decode_frames(frames, decoder)
+    metrics.flush()
+
+    expected = [
+        # start, transactions, bytes, min_rx_headroom, min_tx_bytes, min_tx_headroom, FIFO warnings
+        (0.0, 3, 6, 2, None, None, (1, 0, 1, 0)),
+        (1e-3, 2, 5, None, 3, 2, (0, 1, 0, 1)),
+    ]
+    windows = [
+        (x.start, x.transactions, x.bytes, x.min_rx_headroom, x.min_tx_bytes, x.min_tx_headroom,
+         (x.rx_near_overflow, x.tx_near_full, x.rx_near_empty, x.tx_near_underflow))
+        for x in metrics.windows
+    ]
+    if windows != expected:
+        return "windows {} instead of {}".format(windows, expected)
+    # Gaps 9 us and 8 us (< 10 us), 97 us (< 100 us), 1477 us (< 2 ms)
+    histogram = {index: count for index, count in enumerate(metrics.gap_histogram) if count}
+    if histogram != {3: 2, 6: 1, 10: 1}:
+        return "gap histogram {}".format(histogram)
+    if abs(metrics.windows[0].min_gap - 8e-6) > 1e-12 or abs(metrics.windows[1].max_gap - 1.477e-3) > 1e-12:
+        return "min/max gap {} / {}".format(metrics.windows[0].min_gap, metrics.windows[1].max_gap)
+    return None
+
+# Variable length RX packet (reset configuration, appended status) read in two FIFO accesses between RXBYTES polls
+RX_PACKET = [
+    ([0xFB, 0x00],                          [0x1F, 0x04]),
+    ([0xFF, 0x00, 0x00, 0x00],              [0x1F, 0x05, 0x11, 0x22]),
+    ([0xFB, 0x00],                          [0x1F, 0x05]),
+    ([0xFF, 0x00, 0x00, 0x00, 0x00, 0x00],  [0x1F, 0x33, 0x44, 0x55, 0x2D, 0x9F]),
+]
+
+PACKET_TRAFFIC = RX_PACKET + [
+    # Same packet length, new first fragment (cache miss) and the same second fragment (cache hit)
+    ([0xFF, 0x00, 0x00, 0x00],              [0x1F, 0x05, 0x66, 0x22]),
+    RX_PACKET[3],
+
+    # Fixed length of 4 bytes, then a TX packet
+    ([0x08, 0x04],                          [0x0F, 0x0F]),
+    ([0x06, 0x04],                          [0x0F, 0x0F]),
+    ([0x7F, 0xA1, 0xA2, 0xA3, 0xA4],        [0x0F, 0x0F, 0x0F, 0x0F, 0x0F]),
+    # RX packet cut short by SFRX, then a complete one
+    ([0xFF, 0x00, 0x00, 0x00],              [0x1F, 0x01, 0x02, 0x03]),
+    ([0x3A],                                [0x1F]),
+    ([0xFF] + [0x00] * 6,                   [0x1F, 0x09, 0x08, 0x07, 0x06, 0x30, 0x05]),
+]
+
+# direction, data, rssi, lqi, crc_ok, index of the first and last transaction, fragments, complete
+EXPECTED_PACKETS = [
+    ("RX", "05 11 22 33 44 55", 0x2D, 0x1F, True, 1, 3, 2, True),
+    ("RX", "05 66 22 33 44 55", 0x2D, 0x1F, True, 4, 5, 2, True),
+    ("TX", "a1 a2 a3 a4", None, None, None, 8, 8, 1, True),
+    ("RX", "01 02 03", None, None, None, 9, 9, 1, False),
+    ("RX", "09 08 07 06", 0x30, 0x05, False, 11, 11, 1, True),
+]
+
+def check_packets():
+    '''
+    PacketAssembler output of hand-built FIFO traffic, with and without FrameCache hits.
+    '''
+    from PacketAssembler import PacketAssembler
+    transactions = [(index * 20e-6, mosi, miso) for index, (mosi, miso) in enumerate(PACKET_TRAFFIC)]
+    frames = hand_built(transactions)
+    # Offline with the first packet in its own chunk, as the cache is filled when a chunk is formatted: the second
+    # packet's chunk then holds a miss followed by a hit. Also frame by frame, as in Logic 2.
+    first_chunk = len(hand_built(transactions[:len(RX_PACKET)]))
+    for cache_size, chunk_size in ((0, first_chunk), (4096, first_chunk), (4096, None)):
+        decoder = CC1101SpiDecoder(cache_size=cache_size, track_shadow=True)
+        assembler = PacketAssembler(decoder.protocol.shadow)
+        decoder.listeners.append(assembler)
+        if chunk_size is None:
+            for frame in frames:
+                decoder.decode(frame)
+        else:
+            for _ in iter_decode_frames(frames, decoder, chunk_size):
+                pass
+        packets = [
+            (x.direction, x.data.hex(" "), x.rssi, x.lqi, x.crc_ok, x.first_time, round(x.last_time, 12), x.fragments, x.complete)
+            for x in assembler.packets
+        ]
+        expected = [
+            (direction, data, rssi, lqi, crc_ok, transactions[first][0],
+             round(transactions[last][0] + len(transactions[last][1]) * 1e-6, 12), fragments, complete)
+            for direction, data, rssi, lqi, crc_ok, first, last, fragments, complete in EXPECTED_PACKETS
+        ]
+        if packets != expected:
+            return "cache size {}, chunk size {}: packets {}".format(cache_size, chunk_size, packets)
+        if cache_size and not decoder.cache.hits:
+            return "no cache hits"
+    return None
+
+def check_radio_timeline():
+    '''
+    RadioStateTimeline intervals, MARCSTATE names and illegal commands of a hand-built capture, one transaction per ms.
+    '''
+    from RadioStateTimeline import RadioStateTimeline
+    traffic = [
+        # SCAL, MARCSTATE = STARTCAL with CALIBRATE in the status byte, then the chip is IDLE for 1 s
+        ([0x33], [0x0F]),
+        ([0xF5, 0x00], [0x4F, 0x08]),
+    ] + [([0xBD], [0x0F])] * 1000 + [
+        # MARCSTATE = FS_LOCK polled with SNOP, the status byte misreports SETTLING as IDLE
+        ([0xF5, 0x00], [0x0F, 0x0A]),
+        ([0xBD], [0x0F]),
+        ([0xF5, 0x00], [0x0F, 0x0A]),
+        ([0xBD], [0x0F]),
+        ([0xBD], [0x0F]),
+        # STX in RXFIFO_OVERFLOW
+        ([0xBD], [0x6F]),
+        ([0x35], [0x6F]),
+    ]
+    timeline = RadioStateTimeline(max_intervals=None)
+    decoder = CC1101SpiDecoder()
+    decoder.listeners.append(timeline)
+    decode_frames(hand_built([(index * 1e-3, mosi, miso) for index, (mosi, miso) in enumerate(traffic)]), decoder)
+    timeline.flush()
+
+    intervals = [(x.state, x.source, x.marc_state) for x in timeline.intervals]
+    expected = [
+        ("IDLE", "status", None),
+        ("CALIBRATE", "MARCSTATE", "STARTCAL"),
+        ("IDLE", "status", None),
+        ("SETTLING", "MARCSTATE", "FS_LOCK"),
+        ("IDLE", "status", None),
+        ("RXFIFO_OVERFLOW", "status", None),
+    ]
+    if intervals != expected:
+        return "intervals {}".format(intervals)
+    if timeline.dwell["CALIBRATE"].total >= 1e-3:
+        return "CALIBRATE dwell {} s".format(timeline.dwell["CALIBRATE"].total)
+    violations = [(x.command, x.state) for x in timeline.violations]
+    if violations != [("STX", "RXFIFO_OVERFLOW")]:
+        return "illegal commands {}".format(violations)
+    return None
+
+CHECKS = [
+    check_hla,
+    check_vector,
+    check_parallel,
+    check_cache,
+    check_store,
+    check_filter,
+    check_bus_metrics,
+    check_packets,
+    check_radio_timeline,
+]
+
+
+if __name__ == "__main__":
+    failed = 0
+    for check in CHECKS:
+        try:
+            error = check()
+        except CheckSkipped as skipped:
+            print("{:<24} skipped: {}".format(check.__name__, skipped))
+            continue
+        except Exception as exception:
+            error = "{}: {}".format(type(exception).__name__, exception)
+        print("{:<24} {}".format(check.__name__, "ok" if error is None else "FAIL: " + error))
+        failed += error is not None
+    sys.exit(1 if failed else 0)
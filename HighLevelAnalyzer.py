@@ -1,29 +1,25 @@
 # High Level Analyzer
 # For more information and documentation, please go to https://support.saleae.com/extensions/high-level-analyzer-extensions
 
-from saleae.analyzers import HighLevelAnalyzer, AnalyzerFrame
-from copy import deepcopy
-from CC1101SpiProtocol import CC1101SpiProtocol, ProtocolFrameType, MARC_STATE
+from saleae.analyzers import HighLevelAnalyzer, AnalyzerFrame, ChoicesSetting, StringSetting
+from CC1101SpiProtocol import ProtocolFrameType
+from CC1101SpiDecoder import CC1101SpiDecoder, TransactionFilter
+# Defined here before they moved to CC1101SpiDecoder; re-exported for code importing them from HighLevelAnalyzer
+from CC1101SpiDecoder import SpiFrameType, SpiFrameState
 
 
-SPI_DATA_FRAME = {"mosi": 0, "miso": 0}
-
-
-class SpiFrameType:
-    error = "error"
-    enable = "enable"
-    disable = "disable"
-    result = "result"
-
-class SpiFrameState:
-    idle = 0
-    start = 1
-    active = 2
-    end = 3
-    error = 4
-
 # High level analyzers must subclass the HighLevelAnalyzer class.
-class Hla(HighLevelAnalyzer):
+# The frame state machine and frame data construction live in CC1101SpiDecoder, so they can also run outside Logic 2.
+class Hla(HighLevelAnalyzer, CC1101SpiDecoder):
+
+    # Settings
+    decode_cache = ChoicesSetting(label='Decode cache', choices=('On', 'Off'))
+    collapse_polls = ChoicesSetting(label='Collapse repeated status/command frames', choices=('Off', 'On'))
+    profiling = ChoicesSetting(label='Profile summary every 10000 transactions', choices=('Off', 'On'))
+    filter_registers = StringSetting(label='Only registers (comma separated, e.g. TX/RX FIFO, MARCSTATE)')
+    filter_frame_types = StringSetting(label='Only frame types (comma separated, e.g. fifo, status)')
+    filter_access = ChoicesSetting(label='Only access', choices=('R/W', 'R', 'W'))
+    filter_errors = ChoicesSetting(label='Only errors', choices=('Off', 'On'))
 
     # An optional list of types this analyzer produces, providing a way to customize the way frames are displayed in Logic 2.
     result_types = {
@@ -48,6 +44,9 @@ class Hla(HighLevelAnalyzer):
         ProtocolFrameType.FIFO: {
             'format': 'FIFO: {{data.access}} = {{data.focus_data}}'
         },
+        'profile': {
+            'format': 'Profile: {{data.transactions}} transactions | {{data.frame_state_machine_us}} us'
+        },
     }
 
     def __init__(self):
@@ -55,11 +54,33 @@ class Hla(HighLevelAnalyzer):
         Initialize HLA.
         Settings can be accessed using the same name used above.
         '''
-        self.state = SpiFrameState.idle
-        self.spi_frame_queue = []
-        self.protocol = CC1101SpiProtocol()
-        self.start_time = 0
-        self.end_time = 0
+        CC1101SpiDecoder.__init__(
+            self,
+            cache_size=4096 if self.decode_cache == 'On' else 0,
+            collapse_repeats=self.collapse_polls == 'On',
+            profile=self.profiling == 'On',
+            profile_interval=10000,
+            transaction_filter=self.make_filter(),
+            # The register history can not be queried from Logic 2
+            track_shadow=False,
+        )
+
+    def make_filter(self):
+        '''
+        TransactionFilter from the filter settings, or None if no filter is set.
+        '''
+        registers = self.setting_list(self.filter_registers, str.upper)
+        frame_types = self.setting_list(self.filter_frame_types, str.lower)
+        access = self.filter_access if self.filter_access in ('R', 'W') else None
+        errors_only = self.filter_errors == 'On'
+        if not registers and not frame_types and access is None and not errors_only:
+            return None
+        return TransactionFilter(registers, frame_types, access, errors_only)
+
+    def setting_list(self, value, normalize):
+        if not isinstance(value, str):
+            return []
+        return [normalize(x.strip()) for x in value.split(",") if x.strip()]
 
     def decode(self, frame: AnalyzerFrame):
         '''
@@ -69,136 +90,5 @@ class Hla(HighLevelAnalyzer):
         # Return the data frame itself
         return self.frame_state_machine(frame)
 
-    def frame_state_machine(self, frame):
-        return_frame = None
-
-        # Check for error frames
-        if frame.type == SpiFrameType.error:
-            self.state = SpiFrameState.error
-            return_frame = AnalyzerFrame("spi error", frame.start_time, frame.end_time, {"error_details": "clock in wrong state when enable signal became active"})
-
-        # Check Idle state
-        if self.state == SpiFrameState.idle:
-            if frame.type == SpiFrameType.enable:
-                self.start_time = frame.start_time  # Log start time
-                self.state = SpiFrameState.start
-            else:
-                self.state = SpiFrameState.error
-
-        # Check Start state
-        elif self.state == SpiFrameState.start:
-            if frame.type == SpiFrameType.result:
-                self.start_time = frame.start_time  # Log start time
-                self.end_time = frame.end_time      # Log end time
-                self.state = SpiFrameState.active
-            elif frame.type == SpiFrameType.disable:
-                self.end_time = frame.end_time      # Log end time
-                self.state = SpiFrameState.error
-                return_frame = AnalyzerFrame("spi error", self.start_time, self.end_time, {"error_details": "no SPI frame"})
-            else:
-                self.state = SpiFrameState.error
-
-        # Check Active state
-        elif self.state == SpiFrameState.active:
-            if frame.type == SpiFrameType.disable:
-                self.state = SpiFrameState.end
-            elif frame.type == SpiFrameType.result:
-                self.end_time = frame.end_time      # Log end time
-            else:
-                self.state = SpiFrameState.error
-
-        # Execute Active state
-        if self.state == SpiFrameState.active:
-            self.spi_frame_queue.append(self.get_spi_data_frame(frame))
-
-        # Execute End state
-        if self.state == SpiFrameState.end:
-            if len(self.spi_frame_queue) > 0:
-                protocol_msg = self.protocol.process_frame(self.spi_frame_queue)
-                frame_type, frame_data = self.construct_table(protocol_msg)
-                return_frame = AnalyzerFrame(frame_type, self.start_time, self.end_time, frame_data)
-
-            self.spi_frame_queue.clear()
-
-            # Automatic transition
-            self.state = SpiFrameState.idle
-
-        # Execute Error state
-        elif self.state == SpiFrameState.error:
-
-            # Automatic transition
-            self.state = SpiFrameState.idle
-
-        return return_frame
-
-    def construct_table(self, protocol_msg):
-        frame_type           = protocol_msg["request"]["type"]
-        access               = protocol_msg["request"]["access"]
-        burst                = protocol_msg["request"]["burst"]
-        register             = protocol_msg["request"]["register"]
-        request_data         = protocol_msg["request"]["data"]
-        write_data           = "" if request_data is None else " ".join(["{:02X}".format(x) for x in request_data])
-        response             = protocol_msg["response"]
-        chip_ready           = "" if response is None else "OK" if response["status"]["chip_rdy"] else "NOT RDY"
-        state                = "" if response is None else response["status"]["state"]
-        fifo_bytes_available = "" if response is None else "{}".format(response["status"]["fifo_bytes_available"])
-        read_data            = "" if response is None else " ".join(["{:02X}".format(x) for x in response["data"]])
-        description          = protocol_msg["request"]["description"]
-        focus_data           = ""
-        error_details        = ""
-
-        # Focus Data is used mainly for the Protocol UI labels
-        if frame_type == ProtocolFrameType.ERROR:
-            error_details = protocol_msg["request"]["error"]
-        elif frame_type == ProtocolFrameType.REGISTER:
-            focus_data = write_data if access == "W" else read_data
-        elif frame_type == ProtocolFrameType.COMMAND:
-            pass
-        elif frame_type == ProtocolFrameType.STATUS:
-            if register == "MARCSTATE":
-                marc_state = response["data"][0]
-                if marc_state <= 0x16:
-                    focus_data = MARC_STATE[response["data"][0]]["state"]
-                else:
-                    # See [SWRZ020E] CC1101 Silicon Errata
-                    frame_type = ProtocolFrameType.ERROR
-                    error_details = "Invalid MARCSTATE"
-            else:
-                focus_data = read_data
-        elif frame_type == ProtocolFrameType.PA_TABLE:
-            focus_data = write_data if access == "W" else read_data
-        elif frame_type == ProtocolFrameType.FIFO:
-            focus_data = write_data if access == "W" else read_data
-
-        return (
-            frame_type,
-            {
-                "raw_data":             self.raw_data(),
-                "access":               access,
-                "burst":                burst,
-                "register":             register,
-                "write_data":           write_data,
-                "chip_ready":           chip_ready,
-                "state":                state,
-                "fifo_bytes_available": fifo_bytes_available,
-                "read_data":            read_data,
-                "register_description": description,
-                "focus_data":           focus_data,
-                "error_details":        error_details,
-            }
-        )
-
-    def from_byte(self, data_raw):
-        return int.from_bytes(data_raw, "big")
-
-    def get_spi_data_frame(self, frame):
-        spi_data_frame = deepcopy(SPI_DATA_FRAME)
-        spi_data_frame["mosi"] = self.from_byte(frame.data["mosi"])
-        spi_data_frame["miso"] = self.from_byte(frame.data["miso"])
-        return spi_data_frame
-
-    def raw_data(self):
-        content = "["
-        for frame in self.spi_frame_queue:
-            content += "({:02X}, {:02X}) ".format(frame["mosi"], frame["miso"])
-        return content.rstrip() + "]"
+    def make_frame(self, frame_type, start_time, end_time, data):
+        return AnalyzerFrame(frame_type, start_time, end_time, data)
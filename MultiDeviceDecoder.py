@@ -0,0 +1,191 @@
+# Multi Device Decoder
+# Decodes several CC1101s sharing SPI clock and data lines, with one CSn line per device, in a single pass.
+#
+# A Logic 2 HLA takes a single input analyzer, so in Logic 2 every CSn needs its own SPI analyzer and HLA.
+# Offline, either input works:
+# - the SPI analyzer tables of all CSn lines exported together (Data Table export of all analyzers, rows
+#   sorted by time, analyzer name in the name column), or
+# - the table of a single SPI analyzer without enable channel plus a digital export of the CSn channels
+#   (time column, one column per CSn named after the device); see dispatch_csn.
+# Each row is dispatched to the device's own decoder (SPI frame state machine, protocol and optional register shadow);
+# identical transactions share one FrameCache across the devices. Decoded frames are tagged with data["device"].
+#
+# Usage: python MultiDeviceDecoder.py [--csn csn.csv] capture.csv [output.csv]
+
+import csv
+import sys
+from heapq import heappop, heappush
+from CC1101SpiDecoder import CC1101SpiDecoder, FrameCache, SpiFrame, SpiFrameType
+from OfflineDecoder import TABLE_COLUMNS, CaptureFormatError, chunks, read_capture, read_csv, write_csv
+
+
+class MultiDeviceDecoder:
+    '''
+    One CC1101SpiDecoder per device id, created on the first frame of the device.
+    With collapse_repeats, decoded frames are held back while another device has an earlier pending run of
+    repeated frames, so the frames of all devices are returned in time order.
+    '''
+    def __init__(self, cache_size=4096, collapse_repeats=False, track_shadow=False):
+        self.cache = FrameCache(cache_size) if cache_size > 0 else None
+        self.collapse_repeats = collapse_repeats
+        self.track_shadow = track_shadow
+        self.decoders = {}
+
+        # Frames waiting for the pending runs of other devices: heap of (start_time, sequence, frame)
+        self.held = []
+        self.sequence = 0
+
+    def decoder(self, device):
+        decoder = self.decoders.get(device)
+        if decoder is None:
+            decoder = self.decoders[device] = CC1101SpiDecoder(cache_size=0, collapse_repeats=self.collapse_repeats, track_shadow=self.track_shadow)
+            decoder.cache = self.cache
+        return decoder
+
+    def decode(self, frame, device=None):
+        '''
+        Process one SPI analyzer frame of a device (default: frame.data["device"]).
+        Returns the decoded frames that are complete, as a list, tagged with their device id.
+        '''
+        device = frame.data["device"] if device is None else device
+        return_frame = self.decoder(device).decode(frame)
+        if return_frame is None:
+            frames = []
+        else:
+            frames = self.tag(device, return_frame if type(return_frame) is list else [return_frame])
+        return self.release(frames) if self.collapse_repeats else frames
+
+    def release(self, frames):
+        '''
+        Hold back frames, returning those that start before the pending runs of all devices, in time order.
+        '''
+        held = self.held
+        for frame in frames:
+            heappush(held, (frame.start_time, self.sequence, frame))
+            self.sequence += 1
+        pending = [x.collapser.pending.start_time for x in self.decoders.values() if x.collapser.pending is not None]
+        bound = min(pending) if pending else None
+        released = []
+        while held and (bound is None or held[0][0] < bound):
+            released.append(heappop(held)[2])
+        return released
+
+    def flush(self):
+        '''
+        Frames still held back at the end of a capture, of all devices.
+        '''
+        frames = []
+        for device, decoder in self.decoders.items():
+            frames += self.tag(device, decoder.flush())
+        frames += [x[2] for x in self.held]
+        self.held = []
+        return sorted(frames, key=lambda x: x.start_time)
+
+    def tag(self, device, frames):
+        for frame in frames:
+            frame.data["device"] = device
+        return frames
+
+def read_csn_csv(path):
+    '''
+    Read a Logic 2 digital export of the CSn channels (CSV: time column, then one 0/1 column per channel).
+    Yields (time, channel name, level) for the initial level of every channel and every later change.
+    '''
+    with open(path, newline="") as csv_file:
+        reader = csv.reader(csv_file)
+        channels = [x.strip().strip('"') for x in next(reader, [])][1:]
+        if not channels:
+            raise CaptureFormatError("{}: missing CSn channel columns".format(path))
+        levels = [None] * len(channels)
+        for row in reader:
+            if not row:
+                continue
+            time = float(row[0])
+            for index, value in enumerate(row[1:len(channels) + 1]):
+                level = int(value)
+                if level != levels[index]:
+                    levels[index] = level
+                    yield time, channels[index], level
+
+def csn_edge(low, time, device, level):
+    '''
+    Enable/disable frame of a CSn level change, or None; updates low (devices with CSn low).
+    '''
+    if level == 0 and device not in low:
+        low.append(device)
+        return SpiFrame(SpiFrameType.enable, time, time, {"device": device})
+    if level != 0 and device in low:
+        low.remove(device)
+        return SpiFrame(SpiFrameType.disable, time, time, {"device": device})
+    return None
+
+def dispatch_csn(frames, csn_events):
+    '''
+    Split the table of a single SPI analyzer without enable channel into SPI analyzer frames of several devices
+    (data["device"] set), using CSn level changes (time, device, level) sorted by time, e.g. from read_csn_csv.
+    A falling CSn edge becomes an enable row of the device, a rising edge a disable row. A result row goes to the
+    device whose CSn is low when the byte starts; it is dropped if no CSn is low, and becomes an error row of
+    every device with CSn low if there are several. Error rows go to the devices with CSn low, enable and
+    disable rows of the analyzer are ignored.
+    '''
+    low = []
+    events = iter(csn_events)
+    event = next(events, None)
+    for frame in frames:
+        while event is not None and event[0] <= frame.start_time:
+            edge = csn_edge(low, *event)
+            if edge is not None:
+                yield edge
+            event = next(events, None)
+        if frame.type == SpiFrameType.result and len(low) == 1:
+            yield SpiFrame(frame.type, frame.start_time, frame.end_time, dict(frame.data, device=low[0]))
+        elif frame.type in (SpiFrameType.result, SpiFrameType.error):
+            for device in low:
+                yield SpiFrame(SpiFrameType.error, frame.start_time, frame.end_time, {"device": device})
+    while event is not None:
+        edge = csn_edge(low, *event)
+        if edge is not None:
+            yield edge
+        event = next(events, None)
+
+def iter_decode_devices(frames, decoder=None):
+    '''
+    Decode an iterable of SPI analyzer frames of several devices (data["device"] set, see read_csv(with_device=True)).
+    Yields lists of decoded frames in time order (with collapse_repeats, a run is emitted when it ends).
+    '''
+    decoder = MultiDeviceDecoder() if decoder is None else decoder
+    for chunk in chunks(frames):
+        decoded = []
+        for frame in chunk:
+            decoded += decoder.decode(frame)
+        if decoded:
+            yield decoded
+    decoded = decoder.flush()
+    if decoded:
+        yield decoded
+
+def iter_decode_devices_capture(path, decoder=None, csn_path=None):
+    '''
+    Decode the SPI analyzer tables of several devices (analyzer name in the name column), or with csn_path,
+    the table of a single SPI analyzer without enable channel and a digital export of the CSn channels.
+    '''
+    if csn_path is None:
+        return iter_decode_devices(read_csv(path, with_device=True), decoder)
+    return iter_decode_devices(dispatch_csn(read_capture(path), read_csn_csv(csn_path)), decoder)
+
+
+if __name__ == "__main__":
+    arguments = sys.argv[1:]
+    csn_path = None
+    if arguments[:1] == ["--csn"] and len(arguments) > 1:
+        csn_path = arguments[1]
+        arguments = arguments[2:]
+    if len(arguments) not in (1, 2):
+        sys.exit("usage: python MultiDeviceDecoder.py [--csn csn.csv] capture.csv [output.csv]")
+
+    frame_chunks = iter_decode_devices_capture(arguments[0], csn_path=csn_path)
+    if len(arguments) == 2:
+        with open(arguments[1], "w", newline="") as output_file:
+            write_csv(output_file, frame_chunks, ["device"] + TABLE_COLUMNS)
+    else:
+        write_csv(sys.stdout, frame_chunks, ["device"] + TABLE_COLUMNS)
@@ -0,0 +1,265 @@
+# Offline Decoder
+# Decodes an exported Logic 2 SPI analyzer table without Logic 2 or the saleae package.
+#
+# The decoder is a generator pipeline passing chunks of records between stages:
+#   SPI analyzer rows -> transaction assembler (SpiFrameState machine) -> protocol decode -> formatter
+# Memory use is bounded by the chunk size, not by the capture length.
+#
+# Usage: python OfflineDecoder.py capture.csv [output.csv]
+
+import csv
+import struct
+import sys
+from itertools import islice
+from CC1101SpiDecoder import CC1101SpiDecoder, SpiFrame, SpiFrameType, SpiTransaction
+
+
+# Binary table record: type code, start time [s], end time [s], MOSI byte, MISO byte (little endian)
+BINARY_RECORD = struct.Struct("<BddBB")
+
+# Number of records passed at once between the pipeline stages
+CHUNK_SIZE = 4096
+
+BINARY_FRAME_TYPES = {
+    0: SpiFrameType.enable,
+    1: SpiFrameType.result,
+    2: SpiFrameType.disable,
+    3: SpiFrameType.error,
+}
+
+# Columns of the decoded output table, in the order of CC1101SpiDecoder.construct_table and RepeatCollapser
+TABLE_COLUMNS = [
+    "raw_data",
+    "access",
+    "burst",
+    "register",
+    "write_data",
+    "chip_ready",
+    "state",
+    "fifo_bytes_available",
+    "read_data",
+    "register_description",
+    "focus_data",
+    "error_details",
+    # Only set on collapsed runs of repeated frames
+    "repeat_count",
+    "min_interval",
+    "max_interval",
+]
+
+
+class CaptureFormatError(Exception):
+    pass
+
+def parse_byte(value):
+    '''
+    Parse an exported MOSI/MISO value ("0x0A", "10" or empty) into a single byte.
+    '''
+    value = value.strip()
+    if value == "":
+        return b"\x00"
+    return bytes([int(value, 0)])
+
+def read_csv(path, with_device=False):
+    '''
+    Read an SPI analyzer table exported from Logic 2 as CSV.
+    Required columns: type, start_time, mosi, miso and either duration or end_time.
+    with_device: also require the name column (analyzer name), passed as data["device"] (see MultiDeviceDecoder).
+    '''
+    with open(path, newline="") as csv_file:
+        reader = csv.reader(csv_file)
+        header = [x.strip().strip('"').lower() for x in next(reader, [])]
+        try:
+            type_col = header.index("type")
+            start_col = header.index("start_time")
+            mosi_col = header.index("mosi")
+            miso_col = header.index("miso")
+        except ValueError as error:
+            raise CaptureFormatError("{}: missing column ({})".format(path, error))
+        end_col = header.index("end_time") if "end_time" in header else None
+        duration_col = header.index("duration") if "duration" in header else None
+        if end_col is None and duration_col is None:
+            raise CaptureFormatError("{}: missing column (duration or end_time)".format(path))
+        name_col = header.index("name") if "name" in header else None
+        if with_device and name_col is None:
+            raise CaptureFormatError("{}: missing column (name)".format(path))
+
+        for row in reader:
+            if not row:
+                continue
+            start_time = float(row[start_col])
+            end_time = float(row[end_col]) if end_col is not None else start_time + float(row[duration_col])
+            data = {"mosi": parse_byte(row[mosi_col]), "miso": parse_byte(row[miso_col])}
+            if with_device:
+                data["device"] = row[name_col].strip()
+            yield SpiFrame(row[type_col].strip(), start_time, end_time, data)
+
+def read_binary(path, first_record=0, last_record=None):
+    '''
+    Read an SPI analyzer table stored as packed BINARY_RECORD records.
+    Optionally only the records first_record <= index < last_record are read.
+    '''
+    with open(path, "rb") as binary_file:
+        binary_file.seek(first_record * BINARY_RECORD.size)
+        remaining = None if last_record is None else max(last_record - first_record, 0)
+        while remaining != 0:
+            count = CHUNK_SIZE if remaining is None else min(remaining, CHUNK_SIZE)
+            block = binary_file.read(BINARY_RECORD.size * count)
+            if len(block) % BINARY_RECORD.size != 0:
+                raise CaptureFormatError("{}: truncated record".format(path))
+            if not block:
+                break
+            if remaining is not None:
+                remaining -= len(block) // BINARY_RECORD.size
+            for type_code, start_time, end_time, mosi, miso in BINARY_RECORD.iter_unpack(block):
+                frame_type = BINARY_FRAME_TYPES.get(type_code)
+                if frame_type is None:
+                    raise CaptureFormatError("{}: invalid frame type code {}".format(path, type_code))
+                yield SpiFrame(frame_type, start_time, end_time, {"mosi": bytes([mosi]), "miso": bytes([miso])})
+
+def write_binary(path, frames):
+    '''
+    Store SPI analyzer frames as packed BINARY_RECORD records (e.g. to convert a CSV export once).
+    '''
+    type_codes = {frame_type: type_code for type_code, frame_type in BINARY_FRAME_TYPES.items()}
+    with open(path, "wb") as binary_file:
+        for frame in frames:
+            mosi = frame.data["mosi"][0] if frame.data.get("mosi") else 0
+            miso = frame.data["miso"][0] if frame.data.get("miso") else 0
+            binary_file.write(BINARY_RECORD.pack(type_codes[frame.type], frame.start_time, frame.end_time, mosi, miso))
+
+def read_capture(path):
+    return read_csv(path) if path.lower().endswith(".csv") else read_binary(path)
+
+def chunks(records, chunk_size=CHUNK_SIZE):
+    '''
+    Group an iterable of records into lists of at most chunk_size records.
+    '''
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+def assemble_transactions(frame_chunks, decoder):
+    '''
+    Pipeline stage: SPI analyzer frames -> SpiTransaction records and "spi error" frames.
+    '''
+    assemble = decoder.assemble
+    for chunk in frame_chunks:
+        records = [x for x in map(assemble, chunk) if x is not None]
+        if records:
+            yield records
+
+def decode_transactions(record_chunks, decoder):
+    '''
+    Pipeline stage: SpiTransaction -> (SpiTransaction, ProtocolMessage). Error frames pass through.
+    Transactions found in the decoder's FrameCache become (SpiTransaction, ProtocolMessage, frame).
+    '''
+    process_frame = decoder.protocol.process_frame
+    cached_entry = decoder.cached_entry
+    for chunk in record_chunks:
+        records = []
+        for record in chunk:
+            if type(record) is SpiTransaction:
+                entry = cached_entry(record)
+                record = (record, process_frame(record.spi_bytes, record.end_time)) if entry is None else (record,) + entry
+            records.append(record)
+        yield records
+
+def format_frames(record_chunks, decoder):
+    '''
+    Pipeline stage: (SpiTransaction, ProtocolMessage) -> decoded frame. Error frames pass through.
+    Listeners are notified here for cached frames too, so they see the transactions in capture order.
+    '''
+    format_transaction = decoder.format_transaction
+    notify = decoder.notify
+    for chunk in record_chunks:
+        frames = []
+        for record in chunk:
+            if type(record) is not tuple:
+                frames.append(record)
+            elif len(record) == 2:
+                frames.append(format_transaction(*record))
+            else:
+                notify(*record)
+                frames.append(record[2])
+        yield frames
+
+def filter_frames(frame_chunks, transaction_filter):
+    '''
+    Pipeline stage: drop decoded frames rejected by the TransactionFilter after decoding (see TransactionFilter.accepts).
+    '''
+    accepts = transaction_filter.accepts
+    for chunk in frame_chunks:
+        frames = [x for x in chunk if accepts(x)]
+        if frames:
+            yield frames
+
+def collapse_frames(frame_chunks, collapser):
+    '''
+    Pipeline stage: merge runs of identical STATUS/COMMAND frames (RepeatCollapser), flushed at the end.
+    '''
+    for chunk in frame_chunks:
+        frames = []
+        for frame in chunk:
+            frames += collapser.add(frame)
+        if frames:
+            yield frames
+    frames = collapser.flush()
+    if frames:
+        yield frames
+
+def iter_decode_frames(frames, decoder=None, chunk_size=CHUNK_SIZE):
+    '''
+    Decode an iterable of SPI analyzer frames lazily.
+    Yields lists of decoded frames (DecodedFrame) in capture order.
+    '''
+    decoder = CC1101SpiDecoder() if decoder is None else decoder
+    records = assemble_transactions(chunks(frames, chunk_size), decoder)
+    records = decode_transactions(records, decoder)
+    records = format_frames(records, decoder)
+    if decoder.transaction_filter is not None:
+        records = filter_frames(records, decoder.transaction_filter)
+    if decoder.collapser is not None:
+        records = collapse_frames(records, decoder.collapser)
+    return records
+
+def iter_decode_capture(path, decoder=None, chunk_size=CHUNK_SIZE):
+    '''
+    Decode an exported SPI analyzer table (CSV or binary) with constant memory.
+    Yields lists of decoded frames in capture order.
+    '''
+    return iter_decode_frames(read_capture(path), decoder, chunk_size)
+
+def decode_frames(frames, decoder=None):
+    '''
+    Decode an iterable of SPI analyzer frames.
+    Returns the list of decoded frames (DecodedFrame) in capture order.
+    '''
+    return [x for chunk in iter_decode_frames(frames, decoder) for x in chunk]
+
+def decode_capture(path, decoder=None):
+    '''
+    Decode a whole exported SPI analyzer table (CSV or binary) in one call.
+    '''
+    return decode_frames(read_capture(path), decoder)
+
+def write_csv(output, frame_chunks, columns=TABLE_COLUMNS):
+    writer = csv.writer(output)
+    writer.writerow(["type", "start_time", "end_time"] + columns)
+    for chunk in frame_chunks:
+        writer.writerows([frame.type, frame.start_time, frame.end_time] + [frame.data.get(x, "") for x in columns] for frame in chunk)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        sys.exit("usage: python OfflineDecoder.py capture.csv|capture.bin [output.csv]")
+
+    frame_chunks = iter_decode_capture(sys.argv[1])
+    if len(sys.argv) == 3:
+        with open(sys.argv[2], "w", newline="") as output_file:
+            write_csv(output_file, frame_chunks)
+    else:
+        write_csv(sys.stdout, frame_chunks)
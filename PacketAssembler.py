@@ -0,0 +1,152 @@
+# Packet Assembler
+# Reassembles TX/RX FIFO traffic into radio packets, following the packet handling configuration
+# tracked by the register shadow (PKTCTRL0.LENGTH_CONFIG, PKTLEN, PKTCTRL1.APPEND_STATUS).
+#
+# Usage: python PacketAssembler.py capture.csv|capture.bin
+
+import sys
+from collections import namedtuple
+from CC1101SpiProtocol import ProtocolFrameType
+from CC1101SpiDecoder import CC1101SpiDecoder
+from OfflineDecoder import iter_decode_capture
+
+
+# PKTCTRL0.LENGTH_CONFIG[1:0]
+LENGTH_FIXED = 0
+LENGTH_VARIABLE = 1
+LENGTH_INFINITE = 2
+
+# Radio packet reassembled from FIFO accesses
+#   direction:  "TX" (FIFO writes) or "RX" (FIFO reads)
+#   data:       packet bytes as stored in the FIFO (length byte included in variable length mode), without appended status
+#   rssi, lqi, crc_ok: appended status bytes (RX with PKTCTRL1.APPEND_STATUS=1), otherwise None
+#   first_time: start of the FIFO transaction holding the first packet byte
+#   last_time:  end of the FIFO transaction holding the last packet byte
+#   fragments:  number of FIFO transactions the packet was spread over
+#   complete:   False if the packet was cut short by a flush/reset, or the length is not known (infinite mode)
+Packet = namedtuple("Packet", ["direction", "data", "rssi", "lqi", "crc_ok", "first_time", "last_time", "fragments", "complete"])
+
+
+class PacketBuffer:
+    '''
+    Bytes of the packet currently being transferred in one direction.
+    '''
+    __slots__ = ("direction", "data", "expected_length", "append_status", "first_time", "last_time", "fragments")
+
+    def __init__(self, direction):
+        self.direction = direction
+        self.clear()
+
+    def clear(self):
+        self.data = bytearray()
+        self.expected_length = None
+        self.append_status = False
+        self.first_time = None
+        self.last_time = None
+        self.fragments = 0
+
+class PacketAssembler:
+    '''
+    Decoder listener stitching FIFO reads and writes into complete TX/RX packets.
+    The packet length is taken from the shadow register values at the start of the FIFO access holding the first byte.
+    Values are looked up in the shadow history, as the offline pipeline may update the shadow ahead of the listeners.
+    '''
+    def __init__(self, shadow):
+        if shadow is None:
+            raise ValueError("packet reassembly needs the register shadow (CC1101SpiDecoder(track_shadow=True))")
+        self.shadow = shadow
+        self.tx = PacketBuffer("TX")
+        self.rx = PacketBuffer("RX")
+        self.packets = []
+
+    def register(self, name, time):
+        return self.shadow.value_at(name, time)
+
+    def add_transaction(self, transaction, protocol_msg, frame):
+        request = protocol_msg.request
+        if request.type == ProtocolFrameType.FIFO:
+            if request.access == "W":
+                data = request.data
+                buffer = self.tx
+            elif protocol_msg.response is not None:
+                data = protocol_msg.response.data
+                buffer = self.rx
+            else:
+                return
+            if data:
+                self.add_bytes(buffer, data if request.burst else data[:1], transaction.start_time, transaction.end_time)
+
+        elif request.type == ProtocolFrameType.COMMAND:
+            if request.register in ("SFTX", "SRES"):
+                self.flush(self.tx)
+            if request.register in ("SFRX", "SRES"):
+                self.flush(self.rx)
+
+    def add_bytes(self, buffer, data, start_time, end_time):
+        buffer.fragments += 1
+        while data:
+            if buffer.first_time is None:
+                buffer.first_time = start_time
+            buffer.last_time = end_time
+
+            if buffer.expected_length is None:
+                length_config = self.register("PKTCTRL0", start_time) & 0x03
+                packet_length = self.register("PKTLEN", start_time)
+                if length_config == LENGTH_FIXED and packet_length != 0:
+                    buffer.expected_length = packet_length
+                elif length_config == LENGTH_VARIABLE:
+                    buffer.expected_length = data[0] + 1
+                else:
+                    # Infinite (or reserved) length: the packet ends with a flush
+                    buffer.data += data
+                    return
+                if buffer.direction == "RX" and (self.register("PKTCTRL1", start_time) & 0x04) != 0:
+                    buffer.expected_length += 2
+                    buffer.append_status = True
+
+            needed = buffer.expected_length - len(buffer.data)
+            buffer.data += data[:needed]
+            data = data[needed:]
+            if len(buffer.data) >= buffer.expected_length:
+                self.emit(buffer, True)
+                if data:
+                    # Next packet starts within the same FIFO access
+                    buffer.fragments = 1
+
+    def flush(self, buffer):
+        if buffer.data:
+            self.emit(buffer, False)
+        buffer.clear()
+
+    def emit(self, buffer, complete):
+        data = bytes(buffer.data)
+        rssi = lqi = crc_ok = None
+        if complete and buffer.append_status:
+            data, (rssi, status) = data[:-2], data[-2:]
+            lqi = status & 0x7F
+            crc_ok = (status & 0x80) != 0
+        self.packets.append(Packet(buffer.direction, data, rssi, lqi, crc_ok, buffer.first_time, buffer.last_time, buffer.fragments, complete))
+        buffer.clear()
+
+def assemble_packets(path, decoder=None):
+    '''
+    Decode an exported SPI analyzer table and return the reassembled packets in capture order.
+    '''
+    decoder = CC1101SpiDecoder(track_shadow=True) if decoder is None else decoder
+    assembler = PacketAssembler(decoder.protocol.shadow)
+    decoder.listeners.append(assembler)
+    for _ in iter_decode_capture(path, decoder):
+        pass
+    return assembler.packets
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("usage: python PacketAssembler.py capture.csv|capture.bin")
+
+    print("direction,first_time,last_time,drain_time,length,fragments,complete,rssi,lqi,crc_ok,data")
+    for packet in assemble_packets(sys.argv[1]):
+        print("{},{},{},{},{},{},{},{},{},{},{}".format(
+            packet.direction, packet.first_time, packet.last_time, packet.last_time - packet.first_time, len(packet.data),
+            packet.fragments, packet.complete, "" if packet.rssi is None else packet.rssi,
+            "" if packet.lqi is None else packet.lqi, "" if packet.crc_ok is None else packet.crc_ok, packet.data.hex(" ").upper()))
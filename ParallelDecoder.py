@@ -0,0 +1,103 @@
+# Parallel Decoder
+# Decodes a binary SPI analyzer table (see OfflineDecoder.write_binary) on a process pool.
+#
+# CC1101 transactions are independent once split at CSn-high (disable) boundaries: after every
+# disable row the SPI frame state machine is back in idle with an empty queue. The file is split
+# into shards of about SHARD_SIZE records; every worker moves its shard edges forward to the next
+# CSn-high boundary, so neighbouring shards agree on their common edge without a serial pre-scan.
+# Results are returned in shard order, which is timestamp order, and equal a serial decode.
+#
+# Usage: python ParallelDecoder.py capture.bin [output.csv]
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from OfflineDecoder import BINARY_RECORD, BINARY_FRAME_TYPES, CaptureFormatError, collapse_frames, decode_frames, read_binary, write_csv
+from CC1101SpiDecoder import DecodedFrame, RepeatCollapser, SpiFrameType
+
+
+# Nominal number of records per shard
+SHARD_SIZE = 1 << 18
+
+BINARY_DISABLE = next(x for x, y in BINARY_FRAME_TYPES.items() if y == SpiFrameType.disable)
+
+
+def record_count(path):
+    size = os.path.getsize(path)
+    if size % BINARY_RECORD.size != 0:
+        raise CaptureFormatError("{}: truncated record".format(path))
+    return size // BINARY_RECORD.size
+
+def find_boundary(path, index):
+    '''
+    Index of the first record at or after index that directly follows a disable row (CSn high).
+    Record 0 and the end of the file are always boundaries.
+    '''
+    if index <= 0:
+        return 0
+    position = index - 1
+    with open(path, "rb") as binary_file:
+        binary_file.seek(position * BINARY_RECORD.size)
+        while True:
+            record = binary_file.read(BINARY_RECORD.size)
+            if len(record) < BINARY_RECORD.size:
+                return position
+            if record[0] == BINARY_DISABLE:
+                return position + 1
+            position += 1
+
+def decode_shard(path, first_record, last_record):
+    '''
+    Decode the records between the CSn-high boundaries at or after first_record and last_record.
+    '''
+    start = find_boundary(path, first_record)
+    end = find_boundary(path, last_record)
+    return decode_frames(read_binary(path, start, end))
+
+def iter_decode_capture_parallel(path, processes=None, shard_size=SHARD_SIZE, collapse_repeats=False):
+    '''
+    Decode a binary SPI analyzer table on a process pool.
+    Yields one list of decoded frames per shard, in capture order.
+    Runs of repeated frames may cross shard edges, so they are collapsed after merging.
+    '''
+    shards = iter_decode_shards(path, processes, shard_size)
+    if collapse_repeats:
+        shards = collapse_frames(shards, RepeatCollapser(DecodedFrame))
+    return shards
+
+def iter_decode_shards(path, processes, shard_size):
+    if path.lower().endswith(".csv"):
+        raise CaptureFormatError("{}: convert CSV exports with OfflineDecoder.write_binary first".format(path))
+
+    count = record_count(path)
+    processes = os.cpu_count() if processes is None else processes
+    edges = list(range(0, count, shard_size)) + [count]
+
+    with ProcessPoolExecutor(processes) as executor:
+        # Keep a bounded number of shards in flight, so memory does not grow with the capture length
+        pending = []
+        for first_record, last_record in zip(edges[:-1], edges[1:]):
+            pending.append(executor.submit(decode_shard, path, first_record, last_record))
+            if len(pending) >= 2 * processes:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+def decode_capture_parallel(path, processes=None, shard_size=SHARD_SIZE, collapse_repeats=False):
+    '''
+    Decode a whole binary SPI analyzer table on a process pool.
+    Returns the same list of decoded frames as OfflineDecoder.decode_capture.
+    '''
+    return [x for shard in iter_decode_capture_parallel(path, processes, shard_size, collapse_repeats) for x in shard]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        sys.exit("usage: python ParallelDecoder.py capture.bin [output.csv]")
+
+    shards = iter_decode_capture_parallel(sys.argv[1])
+    if len(sys.argv) == 3:
+        with open(sys.argv[2], "w", newline="") as output_file:
+            write_csv(output_file, shards)
+    else:
+        write_csv(sys.stdout, shards)
@@ -0,0 +1,216 @@
+# Radio State Timeline
+# Rebuilds the radio state over time from the chip status byte of every transaction, MARCSTATE reads and
+# command strobes, with dwell times per state, strobe-to-state latencies and illegal command detection.
+#
+# States are only observed when the MCU accesses the chip: an interval ends at the first transaction showing
+# a different state, so durations are accurate to the polling interval. Intervals use the states of the status
+# byte (STATE_BITS) plus SLEEP and XOFF; MARCSTATE values are mapped onto them (MARC_STATE_GROUPS) and the
+# fine-grained MARCSTATE name is kept in the interval.
+#
+# Illegal command detection only covers the commands in ALLOWED_STATES and FORBIDDEN_STATES.
+#
+# Usage: python RadioStateTimeline.py capture.csv|capture.bin
+
+import sys
+from collections import deque, namedtuple
+from CC1101SpiProtocol import MARC_STATE, ProtocolFrameType, STATUS_TABLE
+from CC1101SpiDecoder import CC1101SpiDecoder
+from OfflineDecoder import iter_decode_capture
+
+
+# Strobes switching the state as soon as CSn goes high; the chip only wakes up again with the next transaction
+STROBE_STATES = {
+    "SIDLE":    "IDLE",
+    "SRES":     "IDLE",
+    "SPWD":     "SLEEP",
+    "SWOR":     "SLEEP",
+    "SXOFF":    "XOFF",
+}
+
+# Strobes reaching their target state after calibration/settling: time to the first transaction in the target state
+STROBE_TARGETS = {
+    "SRX":      "RX",
+    "STX":      "TX",
+    "SFSTXON":  "FSTXON",
+}
+
+# States a command may be issued in (Table 42: Command Strobes)
+ALLOWED_STATES = {
+    "SFRX":     ("IDLE", "RXFIFO_OVERFLOW"),
+    "SFTX":     ("IDLE", "TXFIFO_UNDERFLOW"),
+}
+
+# States a command must not be issued in: a FIFO error has to be cleared with SFRX/SFTX first
+FORBIDDEN_STATES = {
+    "SRX":      ("RXFIFO_OVERFLOW", "TXFIFO_UNDERFLOW"),
+    "STX":      ("RXFIFO_OVERFLOW", "TXFIFO_UNDERFLOW"),
+}
+
+# MARCSTATE states (Figure 25) without an equivalent in the status byte, by the status byte state covering them
+MARC_STATE_GROUPS = {
+    "MANCAL":           "CALIBRATE",
+    "FS_WAKEUP":        "SETTLING",
+    "TXRX_SETTLING":    "SETTLING",
+    "RXTX_SETTLING":    "SETTLING",
+}
+
+# States the status byte may report as IDLE (STATE_BITS, 0b000): if the status byte of a MARCSTATE read showing
+# one of them is IDLE, the IDLE status byte of the next transaction is not taken as a state change
+TRANSITIONAL_STATES = ("CALIBRATE", "SETTLING")
+
+# Radio state between two times; source is the observation that started it (status, MARCSTATE or strobe name),
+# marc_state the last MARCSTATE value read during the interval (e.g. "FS_LOCK"), or None
+StateInterval = namedtuple("StateInterval", ["state", "start_time", "end_time", "source", "marc_state"])
+
+# Command issued in a state it is not allowed in
+IllegalCommand = namedtuple("IllegalCommand", ["time", "command", "state"])
+
+
+class Durations:
+    '''
+    Count, total, min and max of a series of durations [s].
+    '''
+    __slots__ = ("count", "total", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        self.min = duration if self.min is None else min(self.min, duration)
+        self.max = duration if self.max is None else max(self.max, duration)
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+class RadioStateTimeline:
+    '''
+    Decoder listener building the radio state timeline incrementally, in constant time per transaction.
+    The most recent max_intervals intervals and max_violations illegal commands are kept,
+    every closed interval is also passed to on_interval, if given.
+    '''
+    def __init__(self, max_intervals=10000, max_violations=1000, on_interval=None):
+        self.intervals = deque(maxlen=max_intervals)
+        self.on_interval = on_interval
+        self.state = None
+        self.since = None
+        self.source = None
+        self.marc_state = None
+        self.idle_misreported = False
+        self.last_time = None
+
+        self.dwell = {}
+        self.latency = {}
+        self.pending_strobe = None
+        self.pending_target = None
+        self.pending_time = None
+
+        self.violations = deque(maxlen=max_violations)
+        self.violation_count = 0
+
+    def add_transaction(self, transaction, protocol_msg, frame):
+        request = protocol_msg.request
+        status_state = STATUS_TABLE[transaction.spi_bytes[0].miso].state
+
+        if request.type == ProtocolFrameType.COMMAND:
+            allowed = ALLOWED_STATES.get(request.register)
+            forbidden = FORBIDDEN_STATES.get(request.register, ())
+            if (allowed is not None and status_state not in allowed) or status_state in forbidden:
+                self.violations.append(IllegalCommand(transaction.start_time, request.register, status_state))
+                self.violation_count += 1
+
+        if request.register == "MARCSTATE" and protocol_msg.response is not None and protocol_msg.response.data:
+            # The fine-grained state replaces the status byte, which shows IDLE for some transitional states
+            marc_state = MARC_STATE.get(protocol_msg.response.data[0])
+            if marc_state is not None:
+                state = MARC_STATE_GROUPS.get(marc_state["state"], marc_state["state"])
+                self.observe(state, transaction.end_time, "MARCSTATE")
+                self.marc_state = marc_state["state_name"]
+                self.idle_misreported = status_state == "IDLE" and state in TRANSITIONAL_STATES
+        else:
+            # Any other transaction (strobes included) ends the tolerance for a misreported IDLE
+            if not (self.idle_misreported and status_state == "IDLE"):
+                self.observe(status_state, transaction.start_time, "status")
+            self.idle_misreported = False
+
+        if request.type == ProtocolFrameType.COMMAND:
+            state = STROBE_STATES.get(request.register)
+            if state is not None:
+                self.pending_strobe = None
+                self.observe(state, transaction.end_time, request.register)
+            elif request.register in STROBE_TARGETS:
+                self.pending_strobe = request.register
+                self.pending_target = STROBE_TARGETS[request.register]
+                self.pending_time = transaction.end_time
+        self.last_time = transaction.end_time
+
+    def observe(self, state, time, source):
+        if self.pending_strobe is not None and state == self.pending_target:
+            latency = self.latency.get(self.pending_strobe)
+            if latency is None:
+                latency = self.latency[self.pending_strobe] = Durations()
+            latency.add(max(float(time - self.pending_time), 0.0))
+            self.pending_strobe = None
+
+        if state == self.state:
+            return
+        if self.state is not None:
+            self.close(time)
+        self.state = state
+        self.since = time
+        self.source = source
+        self.marc_state = None
+
+    def close(self, time):
+        interval = StateInterval(self.state, self.since, time, self.source, self.marc_state)
+        dwell = self.dwell.get(self.state)
+        if dwell is None:
+            dwell = self.dwell[self.state] = Durations()
+        dwell.add(float(time - self.since))
+        self.intervals.append(interval)
+        if self.on_interval is not None:
+            self.on_interval(interval)
+
+    def flush(self):
+        '''
+        Close the current interval at the last transaction of the capture.
+        '''
+        if self.state is not None:
+            self.close(self.last_time)
+            self.state = None
+
+    def report(self):
+        lines = ["Dwell time per state (count, total, mean / min / max):"]
+        for state, dwell in sorted(self.dwell.items(), key=lambda x: -x[1].total):
+            lines.append("    {:<18} {:>8} x {:>14.6f} s  {:.3e} / {:.3e} / {:.3e} s".format(
+                state, dwell.count, dwell.total, dwell.mean(), dwell.min, dwell.max))
+        lines.append("Strobe to state latency (count, mean / min / max):")
+        for strobe, latency in sorted(self.latency.items()):
+            lines.append("    {:<18} {:>8} x  {:.3e} / {:.3e} / {:.3e} s".format(
+                strobe + " -> " + STROBE_TARGETS[strobe], latency.count, latency.mean(), latency.min, latency.max))
+        lines.append("Illegal commands: {}".format(self.violation_count))
+        for violation in self.violations:
+            lines.append("    {} {} in {}".format(violation.time, violation.command, violation.state))
+        return "\n".join(lines)
+
+def state_timeline(path, decoder=None):
+    '''
+    Decode an exported SPI analyzer table and return its RadioStateTimeline.
+    '''
+    decoder = CC1101SpiDecoder() if decoder is None else decoder
+    timeline = RadioStateTimeline()
+    decoder.listeners.append(timeline)
+    for _ in iter_decode_capture(path, decoder):
+        pass
+    timeline.flush()
+    return timeline
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("usage: python RadioStateTimeline.py capture.csv|capture.bin")
+    print(state_timeline(sys.argv[1]).report())
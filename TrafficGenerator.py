@@ -0,0 +1,171 @@
+# Traffic Generator
+# Synthetic CC1101 SPI traffic for benchmarks: streams of SPI analyzer frames (enable/result/disable/error)
+# as Logic 2 passes them to Hla.decode, covering every header decode path, with a configurable mix.
+#
+# Usage: python TrafficGenerator.py transactions output.csv|output.bin [seed]
+
+import csv
+import random
+import sys
+from CC1101SpiProtocol import CONFIG_REGISTERS, COMMAND_REGISTERS, STATUS_REGISTERS
+from CC1101SpiDecoder import SpiFrame, SpiFrameType
+from OfflineDecoder import write_binary
+
+
+# Relative weights of the transaction kinds
+DEFAULT_MIX = {
+    "register write":   20,
+    "register read":    15,
+    "burst write":      5,
+    "burst read":       5,
+    "command strobe":   10,
+    "status poll":      20,
+    "pa table":         3,
+    "fifo burst":       8,
+    "fifo single":      3,
+    "invalid address":  2,
+    "truncated":        2,
+    "malformed csn":    2,
+}
+
+# Headers without a valid register: address 0x2F in every access mode, 0x37 except burst read (status register WORTIME0)
+INVALID_HEADERS = (0x2F, 0x6F, 0xAF, 0xEF, 0x37, 0x77, 0xB7)
+
+# Chip states reported in the status byte (STATE[2:0]), weighted towards the common ones
+STATUS_STATES = (0b000, 0b000, 0b001, 0b001, 0b001, 0b010, 0b010, 0b011, 0b100, 0b101, 0b110, 0b111)
+
+MARCSTATE_ADDRESS = next(x for x, y in STATUS_REGISTERS.items() if y["register"] == "MARCSTATE")
+
+
+class TrafficGenerator:
+    '''
+    Random CC1101 transactions and the SPI analyzer frames carrying them.
+    byte_time: duration of one SPI byte [s]; gaps between transactions are drawn from gap_range [s].
+    The same seed always produces the same traffic.
+    '''
+    def __init__(self, seed=0, mix=None, byte_time=1e-6, gap_range=(2e-6, 50e-6)):
+        self.random = random.Random(seed)
+        mix = DEFAULT_MIX if mix is None else mix
+        self.kinds = list(mix.keys())
+        self.weights = list(mix.values())
+        self.byte_time = byte_time
+        self.gap_range = gap_range
+        self.config_addresses = sorted(CONFIG_REGISTERS)
+        self.command_addresses = sorted(COMMAND_REGISTERS)
+        self.status_addresses = sorted(STATUS_REGISTERS)
+
+    def status_byte(self):
+        return (self.random.choice(STATUS_STATES) << 4) | self.random.randrange(16)
+
+    def random_bytes(self, count):
+        return [self.random.randrange(256) for _ in range(count)]
+
+    def transaction(self, kind):
+        '''
+        MOSI and MISO bytes of one transaction of the given kind ("malformed csn" is handled by frames()).
+        '''
+        rand = self.random
+        if kind == "register write":
+            mosi = [rand.choice(self.config_addresses), rand.randrange(256)]
+        elif kind == "register read":
+            mosi = [0x80 | rand.choice(self.config_addresses), 0x00]
+        elif kind == "burst write":
+            address = rand.choice(self.config_addresses)
+            mosi = [0x40 | address] + self.random_bytes(rand.randint(2, 8))
+        elif kind == "burst read":
+            address = rand.choice(self.config_addresses)
+            mosi = [0xC0 | address] + [0x00] * rand.randint(2, 8)
+        elif kind == "command strobe":
+            mosi = [rand.choice((0x00, 0x80)) | rand.choice(self.command_addresses)]
+        elif kind == "status poll":
+            address = rand.choice(self.status_addresses)
+            if address == MARCSTATE_ADDRESS:
+                # Mostly valid states, sometimes a value above 0x16 (see CC1101 errata)
+                value = rand.randrange(0x17) if rand.random() < 0.95 else rand.randrange(0x17, 0x20)
+                return [0xC0 | address, 0x00], [self.status_byte(), value]
+            mosi = [0xC0 | address, 0x00]
+        elif kind == "pa table":
+            count = rand.randint(1, 8)
+            if rand.random() < 0.5:
+                mosi = [rand.choice((0x3E, 0x7E))] + self.random_bytes(count)
+            else:
+                mosi = [rand.choice((0xBE, 0xFE))] + [0x00] * count
+        elif kind == "fifo burst":
+            if rand.random() < 0.5:
+                mosi = [0x7F] + self.random_bytes(64)
+            else:
+                mosi = [0xFF] + [0x00] * 64
+        elif kind == "fifo single":
+            mosi = [rand.choice((0x3F, 0xBF)), rand.randrange(256)]
+        elif kind == "invalid address":
+            mosi = [rand.choice(INVALID_HEADERS)] + [0x00] * rand.randint(0, 2)
+        elif kind == "truncated":
+            # Read access cut short after the header byte
+            mosi = [rand.choice((0x80 | rand.choice(self.config_addresses), 0xC0 | rand.choice(self.status_addresses), 0xFF))]
+        else:
+            raise ValueError("unknown transaction kind: {}".format(kind))
+        return mosi, [self.status_byte()] + self.random_bytes(len(mosi) - 1)
+
+    def frames(self, count, start_time=0.0):
+        '''
+        SPI analyzer frames of count random transactions.
+        '''
+        time = start_time
+        for kind in self.random.choices(self.kinds, self.weights, k=count):
+            if kind == "malformed csn":
+                frames = self.malformed_frames(time)
+            else:
+                frames = self.transaction_frames(time, *self.transaction(kind))
+            for frame in frames:
+                yield frame
+            time = frame.end_time + self.random.uniform(*self.gap_range)
+
+    def transaction_frames(self, time, mosi, miso):
+        frames = [SpiFrame(SpiFrameType.enable, time, time, {})]
+        for mosi_byte, miso_byte in zip(mosi, miso):
+            frames.append(SpiFrame(SpiFrameType.result, time, time + self.byte_time, {"mosi": bytes([mosi_byte]), "miso": bytes([miso_byte])}))
+            time += self.byte_time
+        frames.append(SpiFrame(SpiFrameType.disable, time, time, {}))
+        return frames
+
+    def malformed_frames(self, time):
+        '''
+        CSn sequences the SPI frame state machine rejects.
+        '''
+        rand = self.random
+        variant = rand.randrange(4)
+        if variant == 0:
+            # CSn pulse without clocked bytes
+            return [SpiFrame(SpiFrameType.enable, time, time, {}), SpiFrame(SpiFrameType.disable, time + self.byte_time, time + self.byte_time, {})]
+        if variant == 1:
+            # Error reported by the SPI analyzer
+            return [SpiFrame(SpiFrameType.error, time, time + self.byte_time, {})]
+        if variant == 2:
+            # Byte without CSn going low first
+            return [SpiFrame(SpiFrameType.result, time, time + self.byte_time, {"mosi": b"\x3D", "miso": bytes([self.status_byte()])})]
+        # Transaction aborted by a second enable
+        frames = self.transaction_frames(time, *self.transaction("register read"))
+        return frames[:2] + [SpiFrame(SpiFrameType.enable, frames[1].end_time, frames[1].end_time, {})]
+
+def write_csv_export(path, frames):
+    '''
+    Store SPI analyzer frames in the Logic 2 export format read by OfflineDecoder.read_csv.
+    '''
+    with open(path, "w", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["name", "type", "start_time", "duration", "mosi", "miso"])
+        for frame in frames:
+            mosi = "0x{:02X}".format(frame.data["mosi"][0]) if frame.data.get("mosi") else ""
+            miso = "0x{:02X}".format(frame.data["miso"][0]) if frame.data.get("miso") else ""
+            writer.writerow(["SPI", frame.type, repr(frame.start_time), repr(frame.end_time - frame.start_time), mosi, miso])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4):
+        sys.exit("usage: python TrafficGenerator.py transactions output.csv|output.bin [seed]")
+
+    frames = TrafficGenerator(int(sys.argv[3]) if len(sys.argv) == 4 else 0).frames(int(sys.argv[1]))
+    if sys.argv[2].lower().endswith(".csv"):
+        write_csv_export(sys.argv[2], frames)
+    else:
+        write_binary(sys.argv[2], frames)
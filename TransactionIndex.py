@@ -0,0 +1,134 @@
+# Transaction Index
+# Index over decoded frames for fast queries by register, frame type and time window.
+
+from bisect import bisect_left, bisect_right
+from OfflineDecoder import iter_decode_capture
+
+
+class PostingList:
+    '''
+    Positions of the indexed frames sharing one key, with their start times (sorted, capture order).
+    '''
+    __slots__ = ("times", "positions")
+
+    def __init__(self):
+        self.times = []
+        self.positions = []
+
+    def __len__(self):
+        return len(self.positions)
+
+    def bounds(self, start_time=None, end_time=None):
+        '''
+        Slice of the frames starting within [start_time, end_time], found by binary search.
+        '''
+        first = 0 if start_time is None else bisect_left(self.times, start_time)
+        last = len(self.times) if end_time is None else bisect_right(self.times, end_time)
+        return first, max(first, last)
+
+    def window(self, start_time=None, end_time=None):
+        first, last = self.bounds(start_time, end_time)
+        return self.positions[first:last]
+
+class TransactionIndex:
+    '''
+    Built while decoding: a sorted start time array over all frames, plus posting lists per register and per frame type.
+    Frames must be added in capture order.
+    '''
+    def __init__(self):
+        self.frames = []
+        self.all = PostingList()
+        self.by_register = {}
+        self.by_type = {}
+
+    def __len__(self):
+        return len(self.frames)
+
+    def add(self, frame):
+        position = len(self.frames)
+        self.frames.append(frame)
+        self.add_posting(self.all, frame.start_time, position)
+        self.add_posting(self.by_type.setdefault(frame.type, PostingList()), frame.start_time, position)
+        register = frame.data.get("register")
+        if register:
+            self.add_posting(self.by_register.setdefault(register, PostingList()), frame.start_time, position)
+
+    def add_posting(self, posting_list, time, position):
+        posting_list.times.append(time)
+        posting_list.positions.append(position)
+
+    def query(self, register=None, frame_type=None, access=None, start_time=None, end_time=None, predicate=None):
+        '''
+        Frames matching all given criteria, in capture order.
+        The narrowest posting list (register, else frame type) is cut to the time window by binary search,
+        only the frames inside the window are checked against the remaining criteria.
+        '''
+        if register is not None:
+            posting_list = self.by_register.get(register)
+        elif frame_type is not None:
+            posting_list = self.by_type.get(frame_type)
+        else:
+            posting_list = self.all
+        if posting_list is None:
+            return []
+
+        frames = []
+        for position in posting_list.window(start_time, end_time):
+            frame = self.frames[position]
+            if frame_type is not None and frame.type != frame_type:
+                continue
+            if access is not None and frame.data.get("access") != access:
+                continue
+            if predicate is not None and not predicate(frame):
+                continue
+            frames.append(frame)
+        return frames
+
+    def count(self, register=None, frame_type=None, start_time=None, end_time=None):
+        '''
+        Number of frames of a register or frame type within a time window, without visiting them.
+        '''
+        if register is not None and frame_type is not None:
+            return len(self.query(register, frame_type, start_time=start_time, end_time=end_time))
+        if register is not None:
+            posting_list = self.by_register.get(register)
+        elif frame_type is not None:
+            posting_list = self.by_type.get(frame_type)
+        else:
+            posting_list = self.all
+        if posting_list is None:
+            return 0
+        first, last = posting_list.bounds(start_time, end_time)
+        return last - first
+
+def register_value(frame):
+    '''
+    First data byte of a register/status frame (written value for writes, read value for reads), or None.
+    '''
+    data = frame.data.get("write_data") if frame.data.get("access") == "W" else frame.data.get("read_data")
+    return int(data[:2], 16) if data else None
+
+def fifo_overflow(frame):
+    '''
+    RXBYTES/TXBYTES read with the overflow (RX) or underflow (TX) bit set.
+    '''
+    value = register_value(frame)
+    return value is not None and (value & 0x80) != 0
+
+def index_frames(frame_chunks, index):
+    '''
+    Pipeline stage: add every decoded frame to the index and pass the chunks through.
+    '''
+    for chunk in frame_chunks:
+        for frame in chunk:
+            index.add(frame)
+        yield chunk
+
+def index_capture(path, decoder=None):
+    '''
+    Decode an exported SPI analyzer table and return its TransactionIndex.
+    '''
+    index = TransactionIndex()
+    for _ in index_frames(iter_decode_capture(path, decoder), index):
+        pass
+    return index
@@ -0,0 +1,300 @@
+# Transaction Store
+# Compact columnar file format for decoded CC1101 transactions.
+#
+# File layout (little-endian):
+#   header    FILE_HEADER: magic, version, transaction count, offsets and sizes of the sections below
+#   heap      MOSI bytes followed by MISO bytes of every transaction, referenced by payload_offset/payload_length
+#   strings   register names, descriptions and error details, referenced by id (0 is the empty string)
+#   columns   one fixed-width array per entry of COLUMNS, each starting on an 8-byte boundary
+#
+# The reader memory-maps the file; columns and payloads are memoryviews into the mapping (zero-copy).
+#
+# Usage: python TransactionStore.py capture.csv|capture.bin output.cc1101
+
+import mmap
+import struct
+import sys
+from array import array
+from collections import namedtuple
+from CC1101SpiProtocol import ProtocolFrameType, STATUS_TABLE
+from CC1101SpiDecoder import CC1101SpiDecoder
+from OfflineDecoder import CHUNK_SIZE, assemble_transactions, chunks, decode_transactions, format_frames, read_capture
+
+
+FILE_MAGIC = b"CC1101TS"
+FILE_VERSION = 2
+FILE_HEADER = struct.Struct("<8sIIQQQQQ")
+
+# Column name, array typecode
+COLUMNS = (
+    ("start_time",      "d"),
+    ("end_time",        "d"),
+    ("min_interval",    "d"),
+    ("max_interval",    "d"),
+    ("payload_offset",  "Q"),
+    ("payload_length",  "I"),
+    ("repeat_count",    "I"),
+    ("register_id",     "H"),
+    ("description_id",  "H"),
+    ("error_id",        "H"),
+    ("status",          "H"),
+    ("header",          "B"),
+    ("type_code",       "B"),
+)
+
+# Frame type codes used in the type_code column
+FRAME_TYPES = (
+    ProtocolFrameType.REGISTER,
+    ProtocolFrameType.COMMAND,
+    ProtocolFrameType.STATUS,
+    ProtocolFrameType.PA_TABLE,
+    ProtocolFrameType.FIFO,
+    ProtocolFrameType.ERROR,
+    "spi error",
+)
+
+# Value of the status column for frames without a status byte (SPI errors)
+NO_STATUS = 0xFFFF
+
+# One stored transaction; mosi and miso are memoryviews into the file.
+# A collapsed run of repeated frames (RepeatCollapser) is one record with the payload of its first transaction,
+# its repeat_count and the min/max interval between the polls; other records have 1, 0.0, 0.0.
+StoredTransaction = namedtuple("StoredTransaction", [
+    "start_time", "end_time", "type", "header", "status", "register", "description", "error_details", "mosi", "miso",
+    "repeat_count", "min_interval", "max_interval",
+])
+
+
+class StoreFormatError(Exception):
+    pass
+
+class TransactionStoreWriter:
+    '''
+    Writes decoded transactions to a columnar file.
+    Payloads are streamed to the file; the fixed-width columns are kept in memory until close().
+    '''
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.file.write(bytes(FILE_HEADER.size))
+        self.heap_size = 0
+        self.columns = {name: array(typecode) for name, typecode in COLUMNS}
+        self.strings = [""]
+        self.string_ids = {"": 0}
+        self.frame_type_codes = {x: code for code, x in enumerate(FRAME_TYPES)}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def string_id(self, value):
+        value = "" if value is None else value
+        string_id = self.string_ids.get(value)
+        if string_id is None:
+            string_id = len(self.strings)
+            if string_id > 0xFFFF:
+                raise StoreFormatError("too many distinct strings")
+            self.strings.append(value)
+            self.string_ids[value] = string_id
+        return string_id
+
+    def add(self, frame, transaction=None):
+        '''
+        Store a decoded frame and, for decoded transactions, the SpiTransaction it was built from.
+        '''
+        columns = self.columns
+        columns["start_time"].append(frame.start_time)
+        columns["end_time"].append(frame.end_time)
+        columns["type_code"].append(self.frame_type_codes[frame.type])
+        columns["register_id"].append(self.string_id(frame.data.get("register")))
+        columns["description_id"].append(self.string_id(frame.data.get("register_description")))
+        columns["error_id"].append(self.string_id(frame.data.get("error_details")))
+        columns["repeat_count"].append(frame.data.get("repeat_count", 1))
+        columns["min_interval"].append(frame.data.get("min_interval", 0.0))
+        columns["max_interval"].append(frame.data.get("max_interval", 0.0))
+        columns["payload_offset"].append(self.heap_size)
+
+        if transaction is None:
+            columns["payload_length"].append(0)
+            columns["status"].append(NO_STATUS)
+            columns["header"].append(0)
+            return
+
+        payload = bytes([x.mosi for x in transaction.spi_bytes]) + bytes([x.miso for x in transaction.spi_bytes])
+        self.file.write(payload)
+        self.heap_size += len(payload)
+        columns["payload_length"].append(len(transaction.spi_bytes))
+        columns["status"].append(transaction.spi_bytes[0].miso)
+        columns["header"].append(transaction.spi_bytes[0].mosi)
+
+    def close(self):
+        if self.file is None:
+            return
+        strings_offset = FILE_HEADER.size + self.heap_size
+        strings = bytearray(struct.pack("<I", len(self.strings)))
+        for value in self.strings:
+            encoded = value.encode("utf-8")
+            strings += struct.pack("<H", len(encoded)) + encoded
+        self.file.write(strings)
+
+        columns_offset = strings_offset + len(strings)
+        position = columns_offset
+        for name, _ in COLUMNS:
+            padding = -position % 8
+            column = self.columns[name]
+            if sys.byteorder != "little":
+                column.byteswap()
+            self.file.write(bytes(padding) + column.tobytes())
+            position += padding + len(column) * column.itemsize
+
+        self.file.seek(0)
+        self.file.write(FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, 0, len(self.columns["start_time"]),
+                                         FILE_HEADER.size, self.heap_size, strings_offset, columns_offset))
+        self.file.close()
+        self.file = None
+
+class TransactionStoreReader:
+    '''
+    Memory-mapped random access to a columnar transaction file.
+    Columns are available as attributes (e.g. reader.start_time[i]) without copying.
+    Release the mosi/miso views of returned records before close().
+    '''
+    def __init__(self, path):
+        if sys.byteorder != "little":
+            raise StoreFormatError("{}: big-endian hosts are not supported".format(path))
+        with open(path, "rb") as store_file:
+            self.mmap = mmap.mmap(store_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self.mmap)
+        if len(self.buffer) < FILE_HEADER.size:
+            raise StoreFormatError("{}: truncated file".format(path))
+
+        magic, version, _, count, heap_offset, heap_size, strings_offset, columns_offset = FILE_HEADER.unpack_from(self.buffer)
+        if magic != FILE_MAGIC or version != FILE_VERSION:
+            raise StoreFormatError("{}: not a transaction store or unsupported version".format(path))
+        self.count = count
+        self.heap = self.buffer[heap_offset:heap_offset + heap_size]
+
+        string_count, = struct.unpack_from("<I", self.buffer, strings_offset)
+        position = strings_offset + 4
+        self.strings = []
+        for _ in range(string_count):
+            length, = struct.unpack_from("<H", self.buffer, position)
+            self.strings.append(bytes(self.buffer[position + 2:position + 2 + length]).decode("utf-8"))
+            position += 2 + length
+
+        position = columns_offset
+        for name, typecode in COLUMNS:
+            position += -position % 8
+            size = count * array(typecode).itemsize
+            setattr(self, name, self.buffer[position:position + size].cast(typecode))
+            position += size
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return self.record(index)
+
+    def close(self):
+        for name, _ in COLUMNS:
+            getattr(self, name).release()
+        self.heap.release()
+        self.buffer.release()
+        self.mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def record(self, index):
+        offset = self.payload_offset[index]
+        length = self.payload_length[index]
+        return StoredTransaction(
+            self.start_time[index],
+            self.end_time[index],
+            FRAME_TYPES[self.type_code[index]],
+            self.header[index],
+            None if self.status[index] == NO_STATUS else STATUS_TABLE[self.status[index]],
+            self.strings[self.register_id[index]],
+            self.strings[self.description_id[index]],
+            self.strings[self.error_id[index]],
+            self.heap[offset:offset + length],
+            self.heap[offset + length:offset + 2 * length],
+            self.repeat_count[index],
+            self.min_interval[index],
+            self.max_interval[index],
+        )
+
+def decode_records(frame_chunks, decoder):
+    '''
+    Pipeline stage: SPI analyzer frames -> (decoded frame, SpiTransaction) pairs, the transaction is None for SPI errors.
+    Decodes through the OfflineDecoder stages, so cache hits and listeners behave as in OfflineDecoder.
+    '''
+    for chunk in decode_transactions(assemble_transactions(frame_chunks, decoder), decoder):
+        transactions = [x[0] if type(x) is tuple else None for x in chunk]
+        frames = next(format_frames([chunk], decoder))
+        yield list(zip(frames, transactions))
+
+def filter_records(record_chunks, transaction_filter):
+    '''
+    Pipeline stage: OfflineDecoder.filter_frames on (frame, transaction) pairs.
+    '''
+    accepts = transaction_filter.accepts
+    for chunk in record_chunks:
+        records = [x for x in chunk if accepts(x[0])]
+        if records:
+            yield records
+
+def collapse_records(record_chunks, collapser):
+    '''
+    Pipeline stage: OfflineDecoder.collapse_frames on (frame, transaction) pairs.
+    A merged run keeps the transaction of its first frame.
+    '''
+    pending_transaction = None
+    for chunk in record_chunks:
+        records = []
+        for frame, transaction in chunk:
+            pending = collapser.pending
+            frames = collapser.add(frame)
+            if frames and frames[-1] is frame:
+                # Not collapsible, passed on after the flushed run
+                records += [(x, pending_transaction) for x in frames[:-1]]
+                records.append((frame, transaction))
+            else:
+                records += [(x, pending_transaction) for x in frames]
+                if collapser.pending is not pending:
+                    pending_transaction = transaction
+        if records:
+            yield records
+    records = [(x, pending_transaction) for x in collapser.flush()]
+    if records:
+        yield records
+
+def store_capture(capture_path, store_path, decoder=None, chunk_size=CHUNK_SIZE):
+    '''
+    Decode an exported SPI analyzer table (CSV or binary) into a columnar transaction file.
+    The stored frames are those of OfflineDecoder.decode_capture with the same decoder (filter and collapsed runs included).
+    Returns the number of stored transactions.
+    '''
+    decoder = CC1101SpiDecoder() if decoder is None else decoder
+    records = decode_records(chunks(read_capture(capture_path), chunk_size), decoder)
+    if decoder.transaction_filter is not None:
+        records = filter_records(records, decoder.transaction_filter)
+    if decoder.collapser is not None:
+        records = collapse_records(records, decoder.collapser)
+
+    count = 0
+    with TransactionStoreWriter(store_path) as writer:
+        for chunk in records:
+            for frame, transaction in chunk:
+                writer.add(frame, transaction)
+            count += len(chunk)
+    return count
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("usage: python TransactionStore.py capture.csv|capture.bin output.cc1101")
+    print("{} transactions stored".format(store_capture(sys.argv[1], sys.argv[2])))
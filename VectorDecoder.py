@@ -0,0 +1,169 @@
+# Vector Decoder
+# NumPy-vectorized transaction decoding for large offline captures.
+# Requires numpy; the Logic 2 HLA does not use this module.
+
+import numpy as np
+from CC1101SpiProtocol import ProtocolFrameType, ProtocolMessage, Request, Response, HEADER_TABLE, STATUS_TABLE, STATE_BITS
+
+
+# Frame type codes used in the type_code column
+FRAME_TYPES = (
+    ProtocolFrameType.REGISTER,
+    ProtocolFrameType.COMMAND,
+    ProtocolFrameType.STATUS,
+    ProtocolFrameType.PA_TABLE,
+    ProtocolFrameType.FIFO,
+    ProtocolFrameType.ERROR,
+)
+
+# State codes used in the state column (STATE[2:0] of the status byte)
+STATE_NAMES = tuple(STATE_BITS[x]["state"] for x in range(8))
+
+# Header byte -> frame type code, derived from HEADER_TABLE
+HEADER_TYPE_CODES = np.array([FRAME_TYPES.index(x[0]) for x in HEADER_TABLE], dtype=np.uint8)
+
+# Packed record layout of OfflineDecoder.BINARY_RECORD
+BINARY_RECORD_DTYPE = np.dtype([("type", "u1"), ("start_time", "<f8"), ("end_time", "<f8"), ("mosi", "u1"), ("miso", "u1")])
+BINARY_ENABLE = 0
+BINARY_RESULT = 1
+BINARY_DISABLE = 2
+BINARY_ERROR = 3
+
+
+class TransactionArrays:
+    '''
+    Column arrays of decoded transactions, one entry per transaction.
+    Status columns are only meaningful where is_read is True (CC1101SpiProtocol only decodes the response of read accesses).
+    '''
+    __slots__ = (
+        "mosi", "miso", "offset", "length", "start_time", "end_time",
+        "header", "type_code", "is_read", "is_burst",
+        "status", "chip_rdy", "state", "fifo_bytes_available",
+    )
+
+    def __len__(self):
+        return len(self.offset)
+
+    def frame_type(self, index):
+        return FRAME_TYPES[self.type_code[index]]
+
+    def type_counts(self):
+        '''
+        Number of transactions per ProtocolFrameType.
+        '''
+        counts = np.bincount(self.type_code, minlength=len(FRAME_TYPES))
+        return {frame_type: int(count) for frame_type, count in zip(FRAME_TYPES, counts)}
+
+    def message(self, index):
+        '''
+        Build the ProtocolMessage of one transaction, identical to CC1101SpiProtocol.process_frame.
+        '''
+        offset = int(self.offset[index])
+        length = int(self.length[index])
+        mosi = self.mosi[offset:offset + length].tobytes()
+        request = Request(*HEADER_TABLE[mosi[0]], mosi[1:] if length > 1 else None)
+        response = None
+        if self.is_read[index]:
+            miso = self.miso[offset:offset + length].tobytes()
+            response = Response(STATUS_TABLE[miso[0]], miso[1:])
+        return ProtocolMessage(request, response)
+
+def segment_transactions(group):
+    '''
+    Split per-byte CSn group ids into transactions.
+    Returns (offset, length) arrays; consecutive bytes with the same group id form one transaction.
+    '''
+    count = len(group)
+    if count == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    boundaries = np.flatnonzero(group[1:] != group[:-1]) + 1
+    offset = np.concatenate(([0], boundaries)).astype(np.int64)
+    length = np.diff(np.concatenate((offset, [count])))
+    return offset, length
+
+def decode_status(status_byte):
+    '''
+    Bulk decode of chip status bytes: (chip_rdy, state code, fifo_bytes_available).
+    '''
+    status_byte = np.asarray(status_byte, dtype=np.uint8)
+    return (status_byte & 0x80) == 0, (status_byte >> 4) & 0x07, status_byte & 0x0F
+
+def decode_arrays(mosi, miso, group, start_time, end_time):
+    '''
+    Decode per-byte arrays (one entry per SPI byte) into TransactionArrays.
+    Transaction times follow the HLA: start of the first byte, end of the last byte.
+    '''
+    transactions = TransactionArrays()
+    transactions.mosi = np.asarray(mosi, dtype=np.uint8)
+    transactions.miso = np.asarray(miso, dtype=np.uint8)
+    transactions.offset, transactions.length = segment_transactions(np.asarray(group))
+
+    first = transactions.offset
+    last = first + transactions.length - 1
+    transactions.start_time = np.asarray(start_time)[first]
+    transactions.end_time = np.asarray(end_time)[last]
+
+    transactions.header = transactions.mosi[first]
+    transactions.type_code = HEADER_TYPE_CODES[transactions.header]
+    transactions.is_read = (transactions.header & 0x80) != 0
+    transactions.is_burst = (transactions.header & 0x40) != 0
+
+    transactions.status = transactions.miso[first]
+    transactions.chip_rdy, transactions.state, transactions.fifo_bytes_available = decode_status(transactions.status)
+    return transactions
+
+def csn_groups(record_type):
+    '''
+    Transaction id of every SPI analyzer row (the index of its enable row), or -1 for rows outside a decoded transaction.
+    Follows the SPI frame state machine of CC1101SpiDecoder.assemble: disable and error rows return it to idle;
+    between two such rows, the 1st, 3rd, ... enable row starts a transaction and the next enable row aborts it,
+    result rows outside a started transaction are dropped. A transaction is complete when the run ends with a
+    disable row directly after the last starting enable row and its results.
+    '''
+    record_type = np.asarray(record_type)
+    count = len(record_type)
+    groups = np.full(count, -1, dtype=np.int64)
+    if count == 0:
+        return groups
+    index = np.arange(count)
+    reset = (record_type == BINARY_DISABLE) | (record_type == BINARY_ERROR)
+    enable = record_type == BINARY_ENABLE
+
+    # Runs of rows up to and including the next disable/error row
+    run = np.cumsum(reset) - reset
+    run_start = np.flatnonzero(np.concatenate(([True], run[1:] != run[:-1])))
+    run_end = np.concatenate((run_start[1:] - 1, [count - 1]))
+
+    # Enable rank within its run, and the last enable row at or before every row
+    enable_count = np.cumsum(enable)
+    rank = enable_count - 1 - (enable_count - enable)[run_start][run]
+    last_enable = np.maximum.accumulate(np.where(enable, index, -1))
+
+    results = np.flatnonzero(record_type == BINARY_RESULT)
+    start = last_enable[results]
+    result_run = run[results]
+    end = run_end[result_run]
+    valid = (
+        (start >= run_start[result_run])
+        & (rank[np.maximum(start, 0)] % 2 == 0)
+        & (last_enable[end] == start)
+        & (record_type[end] == BINARY_DISABLE)
+    )
+    groups[results[valid]] = start[valid]
+    return groups
+
+def read_binary_arrays(path):
+    '''
+    Load an OfflineDecoder binary table as per-byte arrays (mosi, miso, group, start_time, end_time).
+    Only bytes of transactions the SPI frame state machine would decode are kept (see csn_groups).
+    '''
+    records = np.fromfile(path, dtype=BINARY_RECORD_DTYPE)
+    group = csn_groups(records["type"])
+    results = group >= 0
+    return (
+        records["mosi"][results],
+        records["miso"][results],
+        group[results],
+        records["start_time"][results],
+        records["end_time"][results],
+    )